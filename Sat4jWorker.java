@@ -0,0 +1,70 @@
+import java.io.BufferedInputStream;
+import java.io.BufferedOutputStream;
+import java.io.ByteArrayInputStream;
+import java.io.ByteArrayOutputStream;
+import java.io.DataInputStream;
+import java.io.IOException;
+import java.io.InputStream;
+import java.io.PrintStream;
+import java.util.Map;
+
+import org.sat4j.minisat.SolverFactory;
+import org.sat4j.reader.DimacsReader;
+import org.sat4j.specs.ContradictionException;
+import org.sat4j.specs.IProblem;
+import org.sat4j.specs.ISolver;
+
+// long-lived SAT4J worker used by solverpool.py, so that the JVM is started
+// once and not once per CNF
+// reads CNFs from stdin, each one preceded by a line holding its size in
+// bytes, and answers each of them like "java -jar org.sat4j.core.jar" would,
+// followed by a "c end" line
+public class Sat4jWorker {
+
+    public static void main(String[] args) throws Exception {
+        DataInputStream in = new DataInputStream(new BufferedInputStream(System.in));
+        PrintStream out = new PrintStream(new BufferedOutputStream(System.out), false);
+        String line;
+        while ((line = readLine(in)) != null) {
+            byte[] cnf = new byte[Integer.parseInt(line.trim())];
+            in.readFully(cnf);
+            ISolver solver = SolverFactory.newDefault();
+            DimacsReader reader = new DimacsReader(solver);
+            try {
+                IProblem problem = reader.parseInstance(new ByteArrayInputStream(cnf));
+                if (problem.isSatisfiable()) {
+                    StringBuilder model = new StringBuilder("v");
+                    for (int lit : problem.model()) {
+                        model.append(' ').append(lit);
+                    }
+                    model.append(" 0");
+                    out.println("s SATISFIABLE");
+                    out.println(model);
+                } else {
+                    out.println("s UNSATISFIABLE");
+                }
+            } catch (ContradictionException e) {
+                out.println("s UNSATISFIABLE");
+            }
+            // statistics as "java -jar org.sat4j.core.jar" prints them
+            for (Map.Entry<String, Number> stat : solver.getStat().entrySet()) {
+                out.println("c " + stat.getKey() + " : " + stat.getValue());
+            }
+            out.println("c end");
+            out.flush();
+        }
+    }
+
+    // returns the next line of in without its newline, null at end of input
+    private static String readLine(InputStream in) throws IOException {
+        ByteArrayOutputStream line = new ByteArrayOutputStream();
+        int c;
+        while ((c = in.read()) != '\n') {
+            if (c == -1) {
+                return line.size() == 0 ? null : line.toString("US-ASCII");
+            }
+            line.write(c);
+        }
+        return line.toString("US-ASCII");
+    }
+}
@@ -0,0 +1,218 @@
+#!/usr/bin/python3
+
+# bulk format for large collections of sudokus
+# one sudoku per line, row after row, one character per cell: 0 (or .) for
+# an empty cell, 1-9 then A-Z for 10-35, so a line of a 9x9 sudoku has 81
+# characters, 256 for 16x16 and 625 for 25x25
+# larger sudokus (N up to 1295) take two base 36 digits per cell, most
+# significant first (00 or .. for an empty cell): 2592 characters for 36x36
+# the width is told by the length of the lines, which is a square for one
+# digit per cell and twice a square for two
+# files ending with .gz or .xz are compressed
+#
+# every line has the same length, so whole chunks are parsed at once into
+# (count, N, N) uint8 arrays, and uncompressed files can be memory-mapped to
+# read any sudoku without reading the ones before it
+#
+# ./bulk.py pack <output> <directory|pattern>: packs .txt sudokus in a bulk file
+# ./bulk.py unpack <input> <directory>: writes every sudoku of a bulk file as .txt
+# ./bulk.py solve <input> <output> [backend]: solves every sudoku of a bulk
+#     file and writes the solutions in the same format
+
+import os
+import sys
+import gzip
+import lzma
+import numpy as np
+
+from grid import grid_view, MAX_SIZE as GRID_MAX_SIZE
+
+ALPHABET = b"0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ"
+BASE = len(ALPHABET)
+# largest size with one digit per cell, and with two
+MAX_SIZE = BASE - 1
+MAX_WIDE_SIZE = BASE * BASE - 1
+
+# value of each byte, 255 for the bytes that are not a cell
+DECODE = np.full(256, 255, dtype=np.uint8)
+DECODE[ord(".")] = 0
+for value in range(len(ALPHABET)):
+    DECODE[ALPHABET[value]] = value
+    DECODE[ord(chr(ALPHABET[value]).lower())] = value
+ENCODE = np.frombuffer(ALPHABET, dtype=np.uint8)
+
+# number of sudokus parsed at once
+CHUNK = 1 << 14
+
+def bulk_open(filename, mode="rb"):
+    if filename.endswith(".gz"):
+        return gzip.open(filename, mode)
+    if filename.endswith(".xz"):
+        return lzma.open(filename, mode)
+    return open(filename, mode)
+
+# digits per cell of the sudokus of size N
+def bulk_width(N):
+    return 1 if N <= MAX_SIZE else 2
+
+# (N, width) of the sudokus whose lines hold characters characters
+def bulk_size(characters):
+    for width in [1, 2]:
+        N = int(round((characters / width) ** 0.5))
+        if N * N * width == characters and N >= 1 and bulk_width(N) == width:
+            return N, width
+    exit("illegal bulk input: a line should hold N*N cells, N <= "
+         + str(MAX_WIDE_SIZE) + "\n")
+
+# values of the cells of lines, a (count, N*N*width) array of characters
+def bulk_cells(lines, width):
+    digits = DECODE[lines]
+    if width == 1:
+        return digits
+    if (digits[:, 0::2] == 255).any() or (digits[:, 1::2] == 255).any():
+        exit("illegal bulk input: unknown cell value\n")
+    return digits[:, 0::2].astype(np.uint16) * BASE + digits[:, 1::2]
+
+# turns the lines of data (bytes, all of length record) into a
+# (count, N, N) array, uint8 up to MAX_SIZE and uint16 above
+def bulk_parse(data, N, record, width=1):
+    if len(data) % record == record - 1 and data[-1:] != b"\n":
+        # no newline after the last sudoku
+        data += b"\n"
+    if len(data) % record != 0:
+        exit("illegal bulk input: every line should have the same length\n")
+    lines = np.frombuffer(data, dtype=np.uint8).reshape(-1, record)
+    if (lines[:, -1] != ord("\n")).any():
+        exit("illegal bulk input: every line should have the same length\n")
+    grids = bulk_cells(lines[:, :N * N * width], width)
+    if (grids > N).any():
+        exit("illegal bulk input: unknown cell value\n")
+    return grids.reshape(-1, N, N)
+
+# reads a bulk file chunk after chunk, yields (count, N, N) arrays
+def bulk_read(filename, chunk=CHUNK):
+    myfile = bulk_open(filename)
+    first = myfile.readline()
+    if first == b"":
+        myfile.close()
+        return
+    # lines may end with \r\n
+    record = len(first) if first.endswith(b"\n") else len(first) + 1
+    N, width = bulk_size(len(first.rstrip(b"\r\n")))
+    data = first + myfile.read(record * (chunk - 1))
+    while data != b"":
+        yield bulk_parse(data, N, record, width)
+        data = myfile.read(record * chunk)
+    myfile.close()
+
+# every sudoku of a bulk file in one (count, N, N) array
+def bulk_read_all(filename):
+    chunks = list(bulk_read(filename))
+    if chunks == []:
+        return np.zeros((0, 0, 0), dtype=np.uint8)
+    return np.concatenate(chunks)
+
+# random access to the sudokus of an uncompressed bulk file
+class BulkFile:
+    def __init__(self, filename):
+        myfile = open(filename, "rb")
+        first = myfile.readline()
+        myfile.close()
+        self.N, self.width = bulk_size(len(first.rstrip(b"\r\n")))
+        self.record = len(first)
+        data = np.memmap(filename, dtype=np.uint8, mode="r")
+        if len(data) % self.record != 0:
+            exit("illegal bulk input: every line should have the same length\n")
+        self.lines = data.reshape(-1, self.record)
+
+    def __len__(self):
+        return len(self.lines)
+
+    # sudoku number i, or an array of sudokus for a slice
+    def __getitem__(self, i):
+        lines = self.lines[i, :self.N * self.N * self.width]
+        if lines.ndim == 1:
+            return bulk_cells(lines.reshape(1, -1), self.width).reshape(self.N, self.N)
+        return bulk_cells(lines, self.width).reshape(-1, self.N, self.N)
+
+# the sudokus of grids, a (count, N, N) array, as grid.Grid views of its
+# cells; the uint16 arrays of the sizes above MAX_SIZE are copied to uint8
+# first, and the sizes a Grid cannot hold are lists of lines
+def bulk_grids(grids):
+    if grids.ndim == 3 and grids.shape[1] > GRID_MAX_SIZE:
+        return grids.tolist()
+    if grids.dtype != np.uint8:
+        grids = grids.astype(np.uint8)
+    return [grid_view(grid) for grid in np.ascontiguousarray(grids)]
+
+# writes the sudokus of grids, a (count, N, N) array or a list of grids, to
+# the binary file myfile; an impossible sudoku ([]) is written as an empty
+# grid
+def bulk_write(myfile, grids):
+    if isinstance(grids, list):
+        N = max([len(grid) for grid in grids] + [0])
+        grids = np.array([grid if grid != [] else [[0] * N] * N for grid in grids],
+                         dtype=np.uint16)
+    if len(grids) == 0:
+        return
+    count, N = grids.shape[0], grids.shape[1]
+    if N > MAX_WIDE_SIZE:
+        exit("bulk format only supports sizes up to " + str(MAX_WIDE_SIZE) + "\n")
+    width = bulk_width(N)
+    cells = grids.reshape(count, N * N).astype(np.uint16)
+    lines = np.empty((count, N * N * width + 1), dtype=np.uint8)
+    if width == 1:
+        lines[:, :-1] = ENCODE[cells]
+    else:
+        lines[:, 0:-1:2] = ENCODE[cells // BASE]
+        lines[:, 1:-1:2] = ENCODE[cells % BASE]
+    lines[:, -1] = ord("\n")
+    myfile.write(lines.tobytes())
+
+# packs the .txt sudokus of files in the bulk file output
+def txt_to_bulk(files, output):
+    from sudokub import sudoku_read
+    myfile = bulk_open(output, "wb")
+    for start in range(0, len(files), CHUNK):
+        bulk_write(myfile, [sudoku_read(f) for f in files[start:start + CHUNK]])
+    myfile.close()
+
+# writes every sudoku of the bulk file input as sudokuXX.txt in directory
+def bulk_to_txt(input, directory):
+    from sudokub import sudoku_print
+    os.makedirs(directory, exist_ok=True)
+    index = 0
+    for grids in bulk_read(input):
+        for grid in bulk_grids(grids):
+            myfile = open(os.path.join(directory, "sudoku" + str(index).zfill(2) + ".txt"), "w")
+            sudoku_print(myfile, grid)
+            myfile.close()
+            index += 1
+
+# solves every sudoku of the bulk file input, the solutions are written in
+# the bulk file output in the same order
+def bulk_solve(input, output, name="sat4j"):
+    from sudokub import VarMap, make_backend
+    backend = make_backend(name)
+    myfile = bulk_open(output, "wb")
+    for grids in bulk_read(input):
+        solutions = []
+        for sudoku in bulk_grids(grids):
+            solutions.append(backend.solve(sudoku, VarMap(len(sudoku))))
+        bulk_write(myfile, solutions)
+    myfile.close()
+    backend.close()
+
+if __name__ == "__main__":
+    if len(sys.argv) >= 4 and sys.argv[1] == "pack":
+        from sudokub import batch_files
+        txt_to_bulk(batch_files(sys.argv[3]), sys.argv[2])
+    elif len(sys.argv) == 4 and sys.argv[1] == "unpack":
+        bulk_to_txt(sys.argv[2], sys.argv[3])
+    elif len(sys.argv) in [4, 5] and sys.argv[1] == "solve":
+        bulk_solve(sys.argv[2], sys.argv[3], *sys.argv[4:])
+    else:
+        sys.stdout.write("./bulk.py pack <output> <directory|pattern>\n")
+        sys.stdout.write("./bulk.py unpack <input> <directory>\n")
+        sys.stdout.write("./bulk.py solve <input> <output> [backend]\n")
+        exit("Bad arguments\n")
@@ -0,0 +1,388 @@
+#!/usr/bin/python3
+
+# in-process CDCL SAT solver, used by sudokub.py to avoid starting a JVM for
+# every query
+# clauses are given as lists of non-zero integers like in DIMACS, variables
+# are 1..nvars
+# watched literals, 1UIP clause learning, activity based decisions with phase
+# saving, Luby restarts and periodic reduction of the learnt clauses
+# the solver is incremental: clauses may be added between calls to solve,
+# which can take assumptions, and the learnt clauses are kept for the next
+# calls
+# a seed gives the variables small random initial activities and random
+# initial phases, so that differently seeded solvers search differently
+
+import heapq
+from random import Random
+
+# internally a literal is 2*v for v and 2*v + 1 for -v, so that the negation
+# of a literal l is l ^ 1
+def _internal(lit):
+    return 2 * lit if lit > 0 else -2 * lit + 1
+
+# i-th element of the Luby sequence 1 1 2 1 1 2 4 1 1 2 ...
+def _luby(i):
+    size = 1
+    seq = 0
+    while size < i + 1:
+        seq += 1
+        size = 2 * size + 1
+    while size - 1 != i:
+        size = (size - 1) >> 1
+        seq -= 1
+        i = i % size
+    return 1 << seq
+
+class CDCLSolver:
+    RESTART_BASE = 100
+    VAR_DECAY = 0.95
+
+    def __init__(self, nvars=0, seed=None):
+        self.rng = Random(seed) if seed is not None else None
+        self.nvars = 0
+        # False once a conflict is found at level 0
+        self.ok = True
+        self.clauses = []
+        self.learnts = []
+        # value[l] is 1 if l is true, -1 if false, 0 if unassigned
+        self.value = [0, 0]
+        self.level = [0]
+        self.reason = [None]
+        self.phase = [False]
+        self.activity = [0.0]
+        self.seen = [False]
+        self.watches = [[], []]
+        self.heap = []
+        self.var_inc = 1.0
+        self.trail = []
+        self.trail_lim = []
+        self.qhead = 0
+        self.assumptions = []
+        self.max_learnts = 0
+        self.stats = {"conflicts": 0, "decisions": 0, "propagations": 0,
+                      "restarts": 0}
+        self.new_var(nvars)
+
+    # makes sure variables 1..nvars exist
+    def new_var(self, nvars):
+        while self.nvars < nvars:
+            self.nvars += 1
+            self.value += [0, 0]
+            self.level.append(0)
+            self.reason.append(None)
+            if self.rng is None:
+                self.phase.append(False)
+                self.activity.append(0.0)
+            else:
+                # below any bump, only breaks the ties
+                self.phase.append(self.rng.random() < 0.5)
+                self.activity.append(self.rng.random() * 1e-3)
+            self.seen.append(False)
+            self.watches += [[], []]
+            heapq.heappush(self.heap, (-self.activity[self.nvars], self.nvars))
+
+    # adds a clause, returns False if the formula became unsatisfiable
+    # may only be called between two calls to solve
+    def add_clause(self, lits):
+        if not self.ok:
+            return False
+        value = self.value
+        clause = []
+        for lit in lits:
+            if abs(lit) > self.nvars:
+                self.new_var(abs(lit))
+            lit = _internal(lit)
+            if value[lit] == 1 or lit ^ 1 in clause:
+                # satisfied at level 0 or tautology
+                return True
+            if value[lit] == 0 and not lit in clause:
+                clause.append(lit)
+        if len(clause) == 0:
+            self.ok = False
+        elif len(clause) == 1:
+            self._enqueue(clause[0], None)
+        else:
+            self.clauses.append(clause)
+            self.watches[clause[0]].append(clause)
+            self.watches[clause[1]].append(clause)
+        return self.ok
+
+    # forgets every clause holding the variable var, the learnt ones too, and
+    # its value at level 0, so that var can be used again as a new variable
+    # only sound for a variable that every clause holds with the same sign,
+    # like a guard assumed to enable its clauses: the clauses learnt from
+    # them then hold it too, since an assumption is never resolved away
+    # only the clauses from index start of clauses on are looked at, the
+    # learnt ones all are
+    # may only be called between two calls to solve
+    def release(self, var, start=0):
+        lits = (2 * var, 2 * var + 1)
+        removed = []
+        for clauses, first in ((self.clauses, start), (self.learnts, 0)):
+            kept = []
+            for c in clauses[first:]:
+                if lits[0] in c or lits[1] in c:
+                    removed.append(c)
+                else:
+                    kept.append(c)
+            clauses[first:] = kept
+        for c in removed:
+            # a clause is watched by its first two literals
+            for lit in c[:2]:
+                ws = self.watches[lit]
+                for k in range(len(ws)):
+                    if ws[k] is c:
+                        del ws[k]
+                        break
+        if self.value[lits[0]] != 0:
+            # a unit clause learnt at level 0
+            self.trail.remove(lits[0] if self.value[lits[0]] == 1 else lits[1])
+            self.qhead = len(self.trail)
+            self.value[lits[0]] = self.value[lits[1]] = 0
+            self.reason[var] = None
+            heapq.heappush(self.heap, (-self.activity[var], var))
+
+    # returns the model as a list of literals (one per variable), or None if
+    # the formula is unsatisfiable when the literals of assumptions are true
+    # the assumptions only hold for this call, unlike added clauses
+    def solve(self, assumptions=[]):
+        if not self.ok:
+            return None
+        if self._propagate() is not None:
+            self.ok = False
+            return None
+        for lit in assumptions:
+            if abs(lit) > self.nvars:
+                self.new_var(abs(lit))
+        self.assumptions = [_internal(lit) for lit in assumptions]
+        self.max_learnts = max(len(self.clauses) // 3, 1000)
+        restart = 0
+        while True:
+            status = self._search(_luby(restart) * self.RESTART_BASE)
+            if status is not None:
+                break
+            restart += 1
+            self.stats["restarts"] += 1
+            self.max_learnts += self.max_learnts // 10
+        if status:
+            model = [v if self.value[2 * v] == 1 else -v
+                     for v in range(1, self.nvars + 1)]
+        else:
+            model = None
+        self._cancel_until(0)
+        return model
+
+    # searches for at most nof_conflicts conflicts
+    # returns True if satisfiable, False if not (under the assumptions), None
+    # when the search is interrupted by a restart
+    # the first decision levels are the assumptions, one per level
+    def _search(self, nof_conflicts):
+        conflicts = 0
+        while True:
+            confl = self._propagate()
+            if confl is not None:
+                self.stats["conflicts"] += 1
+                conflicts += 1
+                if len(self.trail_lim) == 0:
+                    self.ok = False
+                    return False
+                learnt, level = self._analyze(confl)
+                self._cancel_until(level)
+                if len(learnt) == 1:
+                    self._enqueue(learnt[0], None)
+                else:
+                    self.learnts.append(learnt)
+                    self.watches[learnt[0]].append(learnt)
+                    self.watches[learnt[1]].append(learnt)
+                    self._enqueue(learnt[0], learnt)
+                self.var_inc /= self.VAR_DECAY
+            else:
+                if conflicts >= nof_conflicts:
+                    self._cancel_until(0)
+                    return None
+                if len(self.learnts) - len(self.trail) >= self.max_learnts:
+                    self._reduce_db()
+                lit = None
+                while len(self.trail_lim) < len(self.assumptions):
+                    p = self.assumptions[len(self.trail_lim)]
+                    if self.value[p] == 1:
+                        # already true, an empty level keeps the numbering
+                        self.trail_lim.append(len(self.trail))
+                    elif self.value[p] == -1:
+                        # the clauses and the previous assumptions imply its
+                        # negation
+                        self._cancel_until(0)
+                        return False
+                    else:
+                        lit = p
+                        break
+                if lit is None:
+                    lit = self._pick_branch_lit()
+                    if lit is None:
+                        return True
+                self.stats["decisions"] += 1
+                self.trail_lim.append(len(self.trail))
+                self._enqueue(lit, None)
+
+    def _enqueue(self, lit, reason):
+        v = lit >> 1
+        self.value[lit] = 1
+        self.value[lit ^ 1] = -1
+        self.level[v] = len(self.trail_lim)
+        self.reason[v] = reason
+        self.trail.append(lit)
+
+    # returns a conflicting clause, or None once every assignment is propagated
+    def _propagate(self):
+        value = self.value
+        watches = self.watches
+        trail = self.trail
+        confl = None
+        while self.qhead < len(trail):
+            p = trail[self.qhead]
+            self.qhead += 1
+            self.stats["propagations"] += 1
+            false_lit = p ^ 1
+            ws = watches[false_lit]
+            i = j = 0
+            n = len(ws)
+            while i < n:
+                c = ws[i]
+                i += 1
+                # the false literal is kept in second position
+                if c[0] == false_lit:
+                    c[0] = c[1]
+                    c[1] = false_lit
+                first = c[0]
+                if value[first] == 1:
+                    ws[j] = c
+                    j += 1
+                    continue
+                for k in range(2, len(c)):
+                    lit = c[k]
+                    if value[lit] != -1:
+                        c[1] = lit
+                        c[k] = false_lit
+                        watches[lit].append(c)
+                        break
+                else:
+                    ws[j] = c
+                    j += 1
+                    if value[first] == -1:
+                        confl = c
+                        while i < n:
+                            ws[j] = ws[i]
+                            j += 1
+                            i += 1
+                    else:
+                        self._enqueue(first, c)
+            del ws[j:]
+            if confl is not None:
+                self.qhead = len(trail)
+                return confl
+        return None
+
+    # 1UIP conflict analysis, returns the learnt clause with its asserting
+    # literal first and the level to backjump to
+    def _analyze(self, confl):
+        seen = self.seen
+        level = self.level
+        trail = self.trail
+        current = len(self.trail_lim)
+        learnt = [0]
+        counter = 0
+        p = None
+        index = len(trail) - 1
+        while True:
+            for k in range(0 if p is None else 1, len(confl)):
+                q = confl[k]
+                v = q >> 1
+                if not seen[v] and level[v] > 0:
+                    seen[v] = True
+                    self._bump(v)
+                    if level[v] >= current:
+                        counter += 1
+                    else:
+                        learnt.append(q)
+            while not seen[trail[index] >> 1]:
+                index -= 1
+            p = trail[index]
+            index -= 1
+            confl = self.reason[p >> 1]
+            seen[p >> 1] = False
+            counter -= 1
+            if counter == 0:
+                break
+        learnt[0] = p ^ 1
+        for q in learnt[1:]:
+            seen[q >> 1] = False
+        if len(learnt) == 1:
+            return learnt, 0
+        best = 1
+        for k in range(2, len(learnt)):
+            if level[learnt[k] >> 1] > level[learnt[best] >> 1]:
+                best = k
+        learnt[1], learnt[best] = learnt[best], learnt[1]
+        return learnt, level[learnt[1] >> 1]
+
+    def _cancel_until(self, level):
+        if len(self.trail_lim) <= level:
+            return
+        value = self.value
+        activity = self.activity
+        start = self.trail_lim[level]
+        for k in range(len(self.trail) - 1, start - 1, -1):
+            lit = self.trail[k]
+            v = lit >> 1
+            value[lit] = 0
+            value[lit ^ 1] = 0
+            self.reason[v] = None
+            self.phase[v] = not (lit & 1)
+            heapq.heappush(self.heap, (-activity[v], v))
+        del self.trail[start:]
+        del self.trail_lim[level:]
+        self.qhead = len(self.trail)
+
+    def _bump(self, v):
+        self.activity[v] += self.var_inc
+        if self.activity[v] > 1e100:
+            self.activity = [a * 1e-100 for a in self.activity]
+            self.var_inc *= 1e-100
+            self.heap = [(-self.activity[u], u) for u in range(1, self.nvars + 1)
+                         if self.value[2 * u] == 0]
+            heapq.heapify(self.heap)
+        elif self.value[2 * v] == 0:
+            heapq.heappush(self.heap, (-self.activity[v], v))
+
+    def _pick_branch_lit(self):
+        heap = self.heap
+        value = self.value
+        activity = self.activity
+        while heap:
+            act, v = heapq.heappop(heap)
+            if value[2 * v] == 0 and -act == activity[v]:
+                return 2 * v if self.phase[v] else 2 * v + 1
+        # stale entries may hide unassigned variables
+        for v in range(1, self.nvars + 1):
+            if value[2 * v] == 0:
+                return 2 * v if self.phase[v] else 2 * v + 1
+        return None
+
+    # forgets the longer half of the learnt clauses that are not the reason
+    # of a current assignment
+    def _reduce_db(self):
+        locked = set(id(self.reason[lit >> 1]) for lit in self.trail)
+        self.learnts.sort(key=len)
+        half = len(self.learnts) // 2
+        kept = self.learnts[:half]
+        for c in self.learnts[half:]:
+            if len(c) <= 2 or id(c) in locked:
+                kept.append(c)
+        self.learnts = kept
+        self.watches = [[] for lit in range(2 * self.nvars + 2)]
+        for c in self.clauses:
+            self.watches[c[0]].append(c)
+            self.watches[c[1]].append(c)
+        for c in self.learnts:
+            self.watches[c[0]].append(c)
+            self.watches[c[1]].append(c)
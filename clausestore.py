@@ -0,0 +1,198 @@
+#!/usr/bin/python3
+
+# compact storage of CNF clauses in int32 NumPy arrays
+# clauses of the same length are kept together in 2D blocks, one clause per
+# row, so they can be generated by array operations, written as DIMACS in a
+# single call or handed to an in-process solver without building them one
+# literal at a time
+
+# numpy is only imported once the first clause is built, so that importing
+# this module (and sudokub.py) stays cheap for the callers that never encode
+class _LazyNumpy:
+    def __getattr__(self, name):
+        import numpy
+        globals()["np"] = numpy
+        return getattr(numpy, name)
+
+np = _LazyNumpy()
+
+# DIMACS text of block, one clause per line
+# every literal is right-aligned in a field as wide as the widest one, which
+# is valid DIMACS (tokens may be separated by several spaces) and lets the
+# whole block be formatted with array operations
+def dimacs_bytes(block):
+    count, width = block.shape
+    if count == 0:
+        return b""
+    if width == 0:
+        return b"0\n" * count
+    values = np.abs(block.astype(np.int64))
+    digits = np.ones(values.shape, dtype=np.int64)
+    power = 10
+    while (values >= power).any():
+        digits += values >= power
+        power *= 10
+    # one space, the sign and the digits of each literal
+    field = int(digits.max()) + 2
+    chars = np.full((count, width, field), ord(" "), dtype=np.uint8)
+    for d in range(field - 2):
+        digit = (values // 10 ** d) % 10
+        chars[:, :, field - 1 - d] = np.where(d < digits, ord("0") + digit, ord(" "))
+    negative = block < 0
+    if negative.any():
+        rows, cols = np.nonzero(negative)
+        chars[rows, cols, field - 1 - digits[rows, cols]] = ord("-")
+    lines = np.empty((count, width * field + 3), dtype=np.uint8)
+    lines[:, :-3] = chars.reshape(count, width * field)
+    lines[:, -3:] = np.frombuffer(b" 0\n", dtype=np.uint8)
+    return lines.tobytes()
+
+# clauses formatted at once by write_dimacs, which bounds the memory taken
+# by dimacs_bytes for the millions of clauses of large sizes
+DIMACS_CHUNK = 1 << 18
+
+class ClauseStore:
+    def __init__(self, nvars=0):
+        # number of variables, auxiliary ones included
+        self.nvars = nvars
+        # 2D int32 arrays, one clause per row
+        self.blocks = []
+        # clauses added one at a time, lists of literals
+        self.clauses = []
+
+    def add_block(self, block):
+        self.blocks.append(np.ascontiguousarray(block, dtype=np.int32))
+
+    # same interface as the other clause outputs of sudokub.py
+    def add_clause(self, lits):
+        self.clauses.append(lits)
+
+    def __len__(self):
+        return sum([len(block) for block in self.blocks]) + len(self.clauses)
+
+    # number of literals of all the clauses
+    def literals(self):
+        return sum([block.size for block in self.blocks]) + sum([len(clause) for clause in self.clauses])
+
+    # hands every clause to out.add_clause, or copies the blocks when out is
+    # another ClauseStore
+    # returns the number of clauses
+    def add_to(self, out):
+        if isinstance(out, ClauseStore):
+            out.blocks += self.blocks
+            out.clauses += self.clauses
+            return len(self)
+        for block in self.blocks:
+            for clause in block.tolist():
+                out.add_clause(clause)
+        for clause in self.clauses:
+            out.add_clause(clause)
+        return len(self)
+
+    # the same clauses over variables numbered offset higher
+    def shifted(self, offset):
+        store = ClauseStore(self.nvars + offset if self.nvars else 0)
+        for block in self.blocks:
+            store.blocks.append(np.where(block > 0, block + offset, block - offset).astype(np.int32))
+        for clause in self.clauses:
+            store.clauses.append([lit + offset if lit > 0 else lit - offset for lit in clause])
+        return store
+
+    # writes every clause in DIMACS format to the binary file myfile
+    # returns the number of bytes written
+    def write_dimacs(self, myfile):
+        size = 0
+        for block in self.blocks:
+            for start in range(0, len(block), DIMACS_CHUNK):
+                text = dimacs_bytes(block[start:start + DIMACS_CHUNK])
+                myfile.write(text)
+                size += len(text)
+        for clause in self.clauses:
+            text = (" ".join([str(lit) for lit in clause]) + " 0\n").encode()
+            myfile.write(text)
+            size += len(text)
+        return size
+
+# at-most-one encodings: each one takes groups, a 2D array with one group of
+# variables per row, and next_var, the first variable free for the auxiliary
+# variables it needs
+# returns the list of its clause blocks and the next free variable
+
+# groups this small are always encoded pairwise by the recursive encodings
+SMALL = 4
+
+# every pair of variables cannot be both true: m(m-1)/2 clauses, no auxiliary
+# variable
+def amo_pairwise(groups, next_var):
+    first, second = np.triu_indices(groups.shape[1], 1)
+    pairs = np.stack([-groups[:, first], -groups[:, second]], axis=2)
+    return [pairs.reshape(-1, 2)], next_var
+
+# sequential counter (Sinz): s_i is true once one of x_1..x_i is
+# 3m-4 clauses and m-1 auxiliary variables
+def amo_sequential(groups, next_var):
+    count, m = groups.shape
+    if m <= 1:
+        return [], next_var
+    s = next_var + np.arange(count * (m - 1), dtype=np.int32).reshape(count, m - 1)
+    blocks = [np.stack([-groups[:, :-1], s], axis=2).reshape(-1, 2),
+              np.stack([-s[:, :-1], s[:, 1:]], axis=2).reshape(-1, 2),
+              np.stack([-groups[:, 1:], -s], axis=2).reshape(-1, 2)]
+    return blocks, next_var + count * (m - 1)
+
+# commander (Klieber and Kwon): the variables are split in subgroups of
+# COMMANDER_GROUP, pairwise at-most-one inside each subgroup, every variable
+# implies the commander of its subgroup and the commanders are encoded again
+COMMANDER_GROUP = 3
+
+def amo_commander(groups, next_var):
+    count, m = groups.shape
+    if m <= SMALL:
+        return amo_pairwise(groups, next_var)
+    g = COMMANDER_GROUP
+    k = -(-m // g)
+    # the last subgroup is padded with 0, clauses using it are dropped
+    padded = np.zeros((count, k * g), dtype=np.int32)
+    padded[:, :m] = groups
+    blocks, next_var = amo_pairwise(padded.reshape(count * k, g), next_var)
+    commanders = next_var + np.arange(count * k, dtype=np.int32).reshape(count, k)
+    next_var += count * k
+    implied = np.repeat(commanders.reshape(count, k, 1), g, axis=2)
+    blocks.append(np.stack([-padded.reshape(count, k, g), implied], axis=3).reshape(-1, 2))
+    blocks = [block[(block != 0).all(axis=1)] for block in blocks]
+    more, next_var = amo_commander(commanders, next_var)
+    return blocks + more, next_var
+
+# product (Chen): the variables are laid out in a p x q grid, each one implies
+# the variable of its row and of its column, and at most one row and one
+# column variable are true, encoded again
+def amo_product(groups, next_var):
+    count, m = groups.shape
+    if m <= SMALL:
+        return amo_pairwise(groups, next_var)
+    p = int(np.ceil(np.sqrt(m)))
+    q = -(-m // p)
+    rows = next_var + np.arange(count * p, dtype=np.int32).reshape(count, p)
+    next_var += count * p
+    columns = next_var + np.arange(count * q, dtype=np.int32).reshape(count, q)
+    next_var += count * q
+    index = np.arange(m)
+    blocks = [np.stack([-groups, rows[:, index // q]], axis=2).reshape(-1, 2),
+              np.stack([-groups, columns[:, index % q]], axis=2).reshape(-1, 2)]
+    more, next_var = amo_product(rows, next_var)
+    blocks += more
+    more, next_var = amo_product(columns, next_var)
+    return blocks + more, next_var
+
+AMO_ENCODINGS = {}
+AMO_ENCODINGS["pairwise"] = amo_pairwise
+AMO_ENCODINGS["sequential"] = amo_sequential
+AMO_ENCODINGS["commander"] = amo_commander
+AMO_ENCODINGS["product"] = amo_product
+
+# at-least-one clause for each row of groups and the at-most-one clauses of
+# the encoding amo
+# returns the list of clause blocks and the next free variable
+def exactly_one_blocks(groups, next_var, amo="pairwise"):
+    blocks, next_var = AMO_ENCODINGS[amo](groups, next_var)
+    return [groups] + blocks, next_var
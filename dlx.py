@@ -0,0 +1,135 @@
+#!/usr/bin/python3
+
+# exact cover with Knuth's Algorithm X over array-backed dancing links
+# node 0 is the root, nodes 1..ncols are the column headers and every 1 of
+# the matrix is a node after them; L, R, U, D are the links of each node,
+# C its column and ROW the name of its row
+
+class ExactCover:
+    def __init__(self, ncols):
+        self.ncols = ncols
+        self.L = [ncols] + list(range(ncols))
+        self.R = list(range(1, ncols + 1)) + [0]
+        self.U = list(range(ncols + 1))
+        self.D = list(range(ncols + 1))
+        self.C = list(range(ncols + 1))
+        self.ROW = [None] * (ncols + 1)
+        # number of nodes in each column
+        self.S = [0] * (ncols + 1)
+
+    # adds a row named name covering the columns cols (numbered from 1)
+    def add_row(self, name, cols):
+        L, R, U, D, C = self.L, self.R, self.U, self.D, self.C
+        first = len(L)
+        for k in range(len(cols)):
+            c = cols[k]
+            node = first + k
+            L.append(node - 1 if k > 0 else first + len(cols) - 1)
+            R.append(node + 1 if k < len(cols) - 1 else first)
+            U.append(U[c])
+            D.append(c)
+            D[U[c]] = node
+            U[c] = node
+            C.append(c)
+            self.ROW.append(name)
+            self.S[c] += 1
+
+    def _cover(self, c):
+        L, R, U, D, C, S = self.L, self.R, self.U, self.D, self.C, self.S
+        R[L[c]] = R[c]
+        L[R[c]] = L[c]
+        i = D[c]
+        while i != c:
+            j = R[i]
+            while j != i:
+                D[U[j]] = D[j]
+                U[D[j]] = U[j]
+                S[C[j]] -= 1
+                j = R[j]
+            i = D[i]
+
+    def _uncover(self, c):
+        L, R, U, D, C, S = self.L, self.R, self.U, self.D, self.C, self.S
+        i = U[c]
+        while i != c:
+            j = L[i]
+            while j != i:
+                S[C[j]] += 1
+                D[U[j]] = j
+                U[D[j]] = j
+                j = L[j]
+            i = U[i]
+        R[L[c]] = c
+        L[R[c]] = c
+
+    # returns up to limit solutions, each one being the list of the names of
+    # the chosen rows
+    def solve(self, limit=1):
+        return list(self.search(limit))
+
+    # yields up to limit solutions, one at a time as they are found; the
+    # search is iterative so its depth is not bounded by the recursion limit
+    # the matrix is restored once the search ends, even when it stops at
+    # limit or its caller drops it, so that the object can search again
+    def search(self, limit=1):
+        R, D, C, S = self.R, self.D, self.C, self.S
+        found = 0
+        chosen = []
+        forward = True
+        try:
+            while True:
+                if forward:
+                    if R[0] == 0:
+                        yield [self.ROW[r] for r in chosen]
+                        found += 1
+                        if found >= limit:
+                            break
+                        forward = False
+                        continue
+                    # column with the fewest remaining rows
+                    c = R[0]
+                    best = c
+                    while c != 0:
+                        if S[c] < S[best]:
+                            best = c
+                            if S[c] <= 1:
+                                break
+                        c = R[c]
+                    self._cover(best)
+                    r = D[best]
+                    if r == best:
+                        self._uncover(best)
+                        forward = False
+                        continue
+                    chosen.append(r)
+                    j = R[r]
+                    while j != r:
+                        self._cover(C[j])
+                        j = R[j]
+                else:
+                    if not chosen:
+                        break
+                    r = chosen.pop()
+                    j = self.L[r]
+                    while j != r:
+                        self._uncover(C[j])
+                        j = self.L[j]
+                    c = C[r]
+                    r = D[r]
+                    if r == c:
+                        self._uncover(c)
+                        continue
+                    chosen.append(r)
+                    j = R[r]
+                    while j != r:
+                        self._cover(C[j])
+                        j = R[j]
+                    forward = True
+        finally:
+            # uncovers what the chosen rows still cover, last one first
+            for r in reversed(chosen):
+                j = self.L[r]
+                while j != r:
+                    self._uncover(C[j])
+                    j = self.L[j]
+                self._uncover(C[r])
@@ -0,0 +1,206 @@
+#!/usr/bin/python3
+
+# compact sudoku grid: the N*N cells in a flat buffer, one byte per cell
+# (so N is at most 255), line after line, with the bitmask of the numbers
+# each line, column and block holds (bit k for number k)
+# a Grid reads like the lists of lines used everywhere else (len, grid[i][j],
+# iterating over its lines, ==), its lines being read-only memoryviews, and
+# grid[i, j] gives a cell without going through a line
+# it is only changed through set, which keeps the masks up to date, so
+# whether a number fits a cell, whether the grid is valid or complete are
+# answered in O(1)
+# copies share the buffer and the masks until one of them is changed (copy
+# on write), and a Grid can be a view of a (N, N) uint8 array, such as a
+# sudoku of a bulk batch, without copying it
+
+import math
+
+MAX_SIZE = 255
+
+class Grid:
+    __slots__ = ("N", "n", "cells", "shared", "rows", "columns", "blocks", "filled",
+                 "clashes", "views")
+
+    # grid of size N holding the bytes of cells (empty by default), copied
+    # unless view; a view is never written to, it is copied by the first set
+    def __init__(self, N, cells=None, view=False):
+        n = math.isqrt(N)
+        if N < 1 or n * n != N or N > MAX_SIZE:
+            exit("a Grid holds sudokus whose size is a perfect square up to "
+                 + str(MAX_SIZE) + "\n")
+        self.N = N
+        self.n = n
+        if cells is None:
+            self.cells = bytearray(N * N)
+        elif view:
+            self.cells = memoryview(cells).cast("B")
+        else:
+            self.cells = bytearray(cells)
+        if len(self.cells) != N * N or max(self.cells) > N:
+            exit("a Grid of size " + str(N) + " needs " + str(N * N)
+                 + " cells from 0 to " + str(N) + "\n")
+        self.shared = view
+        # the masks are only computed once they are needed
+        self.rows = None
+        self.views = None
+
+    # computes the masks, the number of filled cells and of clues clashing
+    # with an earlier one
+    def _masks(self):
+        N = self.N
+        n = self.n
+        cells = self.cells
+        rows = [0] * N
+        columns = [0] * N
+        blocks = [0] * N
+        filled = clashes = 0
+        for i in range(N):
+            for j in range(N):
+                k = cells[i * N + j]
+                if k == 0:
+                    continue
+                bit = 1 << k
+                b = (i // n) * n + j // n
+                if (rows[i] | columns[j] | blocks[b]) & bit:
+                    clashes += 1
+                rows[i] |= bit
+                columns[j] |= bit
+                blocks[b] |= bit
+                filled += 1
+        self.rows = rows
+        self.columns = columns
+        self.blocks = blocks
+        self.filled = filled
+        self.clashes = clashes
+
+    def __len__(self):
+        return self.N
+
+    # line i (a read-only memoryview, or a list of them for a slice), or the
+    # number in cell (i, j) for grid[i, j]
+    def __getitem__(self, key):
+        if isinstance(key, tuple):
+            i, j = key
+            return self.cells[i * self.N + j]
+        if self.views is None:
+            N = self.N
+            cells = memoryview(self.cells).toreadonly()
+            self.views = [cells[i * N:i * N + N] for i in range(N)]
+        return self.views[key]
+
+    def __iter__(self):
+        return iter(self[0:self.N])
+
+    # puts number k (0 to empty it) in cell (i, j)
+    # returns False, leaving the grid as it is, if a line, column or block
+    # of the cell already holds k
+    def set(self, i, j, k):
+        N = self.N
+        if self.rows is None:
+            self._masks()
+        old = self.cells[i * N + j]
+        if old == k:
+            return True
+        b = (i // self.n) * self.n + j // self.n
+        bit = 1 << k
+        # a grid whose clues already clash takes any number
+        if k > 0 and self.clashes == 0 and (self.rows[i] | self.columns[j] | self.blocks[b]) & bit:
+            return False
+        if self.shared:
+            self.cells = bytearray(self.cells)
+            self.rows = self.rows[:]
+            self.columns = self.columns[:]
+            self.blocks = self.blocks[:]
+            self.shared = False
+            self.views = None
+        self.cells[i * N + j] = k
+        if self.clashes > 0:
+            # the masks cannot tell which clue a clash came from
+            self._masks()
+            return True
+        if old > 0:
+            self.rows[i] &= ~(1 << old)
+            self.columns[j] &= ~(1 << old)
+            self.blocks[b] &= ~(1 << old)
+            self.filled -= 1
+        if k > 0:
+            self.rows[i] |= bit
+            self.columns[j] |= bit
+            self.blocks[b] |= bit
+            self.filled += 1
+        return True
+
+    # mask of the numbers none of the line, column and block of cell (i, j)
+    # holds
+    def candidates(self, i, j):
+        if self.rows is None:
+            self._masks()
+        full = (1 << (self.N + 1)) - 2
+        b = (i // self.n) * self.n + j // self.n
+        return full & ~(self.rows[i] | self.columns[j] | self.blocks[b])
+
+    # True if number k can be put in the empty cell (i, j)
+    def fits(self, i, j, k):
+        return self.cells[i * self.N + j] == 0 and self.candidates(i, j) >> k & 1 == 1
+
+    # True if no two clues of a line, column or block are the same number
+    def valid(self):
+        if self.rows is None:
+            self._masks()
+        return self.clashes == 0
+
+    # True if every cell is filled
+    def complete(self):
+        if self.rows is None:
+            self._masks()
+        return self.filled == self.N * self.N
+
+    # a copy sharing the buffer and the masks of this grid until either one
+    # is changed
+    def copy(self):
+        if self.rows is None:
+            self._masks()
+        other = Grid.__new__(Grid)
+        for name in Grid.__slots__:
+            setattr(other, name, getattr(self, name))
+        self.shared = other.shared = True
+        return other
+
+    # the lines of the grid as lists
+    def tolist(self):
+        N = self.N
+        return [list(self.cells[i * N:i * N + N]) for i in range(N)]
+
+    def tobytes(self):
+        return bytes(self.cells)
+
+    def __eq__(self, other):
+        if isinstance(other, Grid):
+            return self.N == other.N and self.cells == other.cells
+        if isinstance(other, list):
+            return len(other) == self.N and self.tolist() == other
+        return NotImplemented
+
+    def __hash__(self):
+        return hash(bytes(self.cells))
+
+    def __repr__(self):
+        return "Grid(" + str(self.N) + ", " + repr(bytes(self.cells)) + ")"
+
+    # (N, N) uint8 array of the cells, so that numpy takes a Grid like a
+    # list of lines
+    def __array__(self, dtype=None, copy=None):
+        import numpy as np
+        array = np.frombuffer(self.cells, dtype=np.uint8).reshape(self.N, self.N)
+        return array.astype(dtype if dtype is not None else np.uint8)
+
+# sudoku (a list of lines or a Grid) as a Grid, sudoku itself if it is one
+def to_grid(sudoku):
+    if isinstance(sudoku, Grid):
+        return sudoku
+    return Grid(len(sudoku), bytes([number for line in sudoku for number in line]))
+
+# Grid viewing the cells of array, a C-contiguous (N, N) uint8 array, without
+# copying them
+def grid_view(array):
+    return Grid(len(array), array, True)
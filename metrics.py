@@ -0,0 +1,86 @@
+#!/usr/bin/python3
+
+# instrumentation of sudokub.py: the time spent in each phase of a query
+# (read, presolve, cache, encode, write, solve, decode), measured with a
+# monotonic clock, and counters (clauses and literals emitted, CNF bytes
+# written, solver calls, statistics of the solver)
+# a query is one sudoku handled by an operation: the metrics are reset before
+# it and written as one JSON line after it
+# nothing is recorded unless enabled is set
+
+import json
+import time
+
+class Metrics:
+    def __init__(self):
+        self.enabled = False
+        self.reset()
+
+    def reset(self):
+        self.phases = {}
+        self.counters = {}
+
+    # adds value to the counter called name
+    def count(self, name, value=1):
+        if self.enabled:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    # adds the time spent in a with statement to the phase called name
+    def phase(self, name):
+        return Phase(self, name)
+
+    def as_dict(self):
+        phases = {}
+        for name in self.phases:
+            phases[name] = round(self.phases[name], 6)
+        return {"phases": phases, "counters": dict(self.counters)}
+
+    # writes the metrics of the query as a JSON line to myfile, after the
+    # entries of fields
+    def write_json(self, myfile, fields, metrics=None):
+        record = dict(fields)
+        record.update(metrics if metrics is not None else self.as_dict())
+        myfile.write(json.dumps(record) + "\n")
+        myfile.flush()
+
+class Phase:
+    def __init__(self, metrics, name):
+        self.metrics = metrics
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.monotonic()
+        return self
+
+    def __exit__(self, *args):
+        if self.metrics.enabled:
+            phases = self.metrics.phases
+            phases[self.name] = phases.get(self.name, 0) + time.monotonic() - self.start
+
+# the metrics of the current process
+METRICS = Metrics()
+
+# statistics printed by SAT4J on its "c <name> : <value>" lines, and the
+# counters they are added to
+SAT4J_STATISTICS = {}
+SAT4J_STATISTICS["conflicts"] = "conflicts"
+SAT4J_STATISTICS["decisions"] = "decisions"
+SAT4J_STATISTICS["propagations"] = "propagations"
+SAT4J_STATISTICS["starts"] = "restarts"
+
+# counts the statistic of a comment line of SAT4J, if it is one of
+# SAT4J_STATISTICS
+def sat4j_statistic(line):
+    fields = line[1:].split(":")
+    if len(fields) != 2:
+        return
+    name = fields[0].strip()
+    value = fields[1].strip()
+    if name in SAT4J_STATISTICS and value.isdigit():
+        METRICS.count(SAT4J_STATISTICS[name], int(value))
+
+# counts the difference between two snapshots of the stats of a
+# cdcl.CDCLSolver
+def cdcl_statistics(before, after):
+    for name in after:
+        METRICS.count(name, after[name] - before.get(name, 0))
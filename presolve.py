@@ -0,0 +1,121 @@
+#!/usr/bin/python3
+
+# constraint propagation on candidate bitmasks, run before any encoding
+# bit k of a mask stands for number k: every line, column and block keeps the
+# mask of the numbers it already holds, and the candidates of an empty cell
+# are the numbers none of its three units holds
+# naked singles (a cell with a single candidate) and hidden singles (a number
+# with a single cell left in a unit) are placed until neither applies; easy
+# sudokus are solved there, the others reach the solver with fewer candidates
+# a grid.Grid brings its masks along, only its lines are copied
+
+from grid import Grid
+
+# the units (lines, columns, blocks) of each size, lists of cells
+_units = {}
+
+def sudoku_units(N):
+    if not N in _units:
+        n = int(round(N ** 0.5))
+        units = [[(i, j) for j in range(N)] for i in range(N)]
+        units += [[(i, j) for i in range(N)] for j in range(N)]
+        units += [[(bi + k, bj + l) for k in range(n) for l in range(n)]
+                  for bi in range(0, N, n) for bj in range(0, N, n)]
+        _units[N] = units
+    return _units[N]
+
+# returns (grid, domains): sudoku with every number propagation places, and
+# the candidate mask of each cell (the bit of its number for a filled one)
+# returns (None, None) when propagation finds a contradiction
+def presolve(sudoku):
+    N = len(sudoku)
+    n = int(round(N ** 0.5))
+    full = (1 << (N + 1)) - 2
+    grid = [list(line) for line in sudoku]
+    known = isinstance(sudoku, Grid) and sudoku.valid()
+    if known:
+        rows = sudoku.rows[:]
+        columns = sudoku.columns[:]
+        blocks = sudoku.blocks[:]
+    else:
+        rows = [0] * N
+        columns = [0] * N
+        blocks = [0] * N
+
+    # puts number (given by its bit) in cell (i, j), False on a conflict
+    def place(i, j, bit):
+        b = (i // n) * n + j // n
+        if (rows[i] | columns[j] | blocks[b]) & bit:
+            return False
+        grid[i][j] = bit.bit_length() - 1
+        rows[i] |= bit
+        columns[j] |= bit
+        blocks[b] |= bit
+        return True
+
+    def candidates(i, j):
+        return full & ~(rows[i] | columns[j] | blocks[(i // n) * n + j // n])
+
+    empty = []
+    for i in range(N):
+        for j in range(N):
+            if grid[i][j] == 0:
+                empty.append((i, j))
+            elif not known and not place(i, j, 1 << grid[i][j]):
+                return None, None
+
+    changed = True
+    while changed:
+        changed = False
+        # naked singles
+        left = []
+        for (i, j) in empty:
+            mask = candidates(i, j)
+            if mask == 0:
+                return None, None
+            if mask & (mask - 1) == 0:
+                place(i, j, mask)
+                changed = True
+            else:
+                left.append((i, j))
+        empty = left
+        if empty == []:
+            break
+        # hidden singles
+        for unit in sudoku_units(N):
+            once = twice = placed = 0
+            for (i, j) in unit:
+                if grid[i][j] > 0:
+                    placed |= 1 << grid[i][j]
+                    continue
+                mask = candidates(i, j)
+                twice |= once & mask
+                once |= mask
+            if once | placed != full:
+                # a number has no cell left in this unit
+                return None, None
+            singles = once & ~twice & ~placed
+            while singles:
+                bit = singles & -singles
+                singles ^= bit
+                for (i, j) in unit:
+                    if grid[i][j] == 0 and candidates(i, j) & bit:
+                        if not place(i, j, bit):
+                            return None, None
+                        changed = True
+                        break
+                else:
+                    # an earlier single of this unit took its last cell
+                    return None, None
+        empty = [(i, j) for (i, j) in empty if grid[i][j] == 0]
+
+    domains = [[1 << grid[i][j] if grid[i][j] > 0 else candidates(i, j)
+                for j in range(N)] for i in range(N)]
+    return grid, domains
+
+# True if grid has no empty cell left
+def presolved(grid):
+    for line in grid:
+        if 0 in line:
+            return False
+    return True
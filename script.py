@@ -1,453 +1,392 @@
 #!/usr/bin/python3
 
-import time
-import numpy as np
-import matplotlib.pyplot as plt
+# benchmark of sudokub.py
+#
+# ./script.py run [flags]: times every configuration (backend, encoding,
+#     operation) on every corpus and writes the results as JSON
+# ./script.py check <results>.json <baseline>.json [tolerance]: fails when a
+#     configuration of results is slower than in baseline
+# ./script.py plot <results>.json [directory]: draws one boxplot per size,
+#     the only step needing matplotlib
+# ./script.py scale [flags]: how the encoding time, the size of the CNF and
+#     the solving time grow with N, on generated sudokus of any size
+#
+# a corpus is a directory sudoku<N>x<N> next to this script, its solutions
+# are in the matching -sol directory when there is one
+
+import io
+import os
+import re
 import sys
-import subprocess
-from random import random
+import json
+import time
+import platform
+from random import Random
 
-# reads a sudoku from file
-# columns are separated by |, lines by newlines
-# Example of a 4x4 sudoku:
-# |1| | | |
-# | | | |3|
-# | | |2| |
-# | |2| | |
-# spaces and empty lines are ignored
+import numpy as np
 
-def sudoku_read(filename):
-    myfile = open(filename, 'r')
-    sudoku = []
-    N = 0
-    for line in myfile:
-        line = line.replace(" ", "")
-        if line == "":
+from sudokub import (sudoku_read, VarMap, ReducedVarMap, BACKENDS, make_backend,
+                     batch_files, batch_solution_file, sudoku_block_size,
+                     sudoku_valid_size, sudoku_template, sudoku_dump_cnf,
+                     sudoku_generic_clauses, parse_flags)
+from clausestore import AMO_ENCODINGS
+from metrics import METRICS
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+# encodings a configuration can use: the at-most-one encodings of the generic
+# constraints, or the reduced encoding
+ENCODINGS = list(AMO_ENCODINGS) + ["reduced"]
+
+# operations a configuration can time: solve, the uniqueness check with two
+# solutions in one search, or with a single query over two copies of the grid
+OPERATIONS = ["solve", "unique", "pair"]
+
+PERCENTILES = [50, 95, 99]
+
+# the corpora next to this script, sorted by size
+def discover_corpora():
+    corpora = []
+    for name in os.listdir(HERE):
+        match = re.fullmatch(r"sudoku(\d+)x(\d+)", name)
+        if match and match.group(1) == match.group(2):
+            corpora.append(os.path.join(HERE, name))
+    return sorted(corpora, key=lambda corpus: int(os.path.basename(corpus)[6:].split("x")[0]))
+
+# the sudokus of corpus (at most count of them if count is not None) and
+# their known solutions, None for the ones without a solution file
+def load_corpus(corpus, count=None):
+    files = batch_files(corpus)[:count]
+    sudokus = [sudoku_read(filename) for filename in files]
+    solutions = [sudoku_read(batch_solution_file(filename))
+                 if os.path.exists(batch_solution_file(filename)) else None
+                 for filename in files]
+    return sudokus, solutions
+
+def varmap_for(sudoku, encoding):
+    if encoding == "reduced":
+        return ReducedVarMap(sudoku)
+    return VarMap(len(sudoku), encoding)
+
+# runs operation on sudoku, returns the solution found ([] if none)
+def run_operation(backend, operation, sudoku, encoding):
+    varmap = varmap_for(sudoku, encoding)
+    if operation == "pair":
+        found = backend.pair(sudoku, varmap)
+        if found == []:
+            found = backend.solutions(sudoku, varmap, 1)
+    else:
+        found = backend.solutions(sudoku, varmap, 2 if operation == "unique" else 1)
+    return found[0] if found != [] else []
+
+# times one configuration on the sudokus of a corpus: warmup sudokus are
+# solved first without being timed, then every sudoku is timed repeats times
+# returns the result entry of the configuration
+def benchmark(sudokus, solutions, name, encoding, operation, warmup, repeats):
+    backend = make_backend(name)
+    for sudoku in sudokus[:warmup]:
+        run_operation(backend, operation, sudoku, encoding)
+    samples = []
+    correct = 0
+    for repeat in range(repeats):
+        for i in range(len(sudokus)):
+            start = time.monotonic()
+            solution = run_operation(backend, operation, sudokus[i], encoding)
+            samples.append(time.monotonic() - start)
+            if repeat == 0 and solution != [] and solution == solutions[i]:
+                correct += 1
+    backend.close()
+    times = np.array(samples)
+    result = {"backend": name, "encoding": encoding, "operation": operation,
+              "sudokus": len(sudokus), "checked": sum([1 for s in solutions if s is not None]),
+              "correct": correct, "samples": samples,
+              "mean": float(np.mean(times)), "min": float(np.min(times)),
+              "max": float(np.max(times)),
+              # sudokus per second, over every repeat
+              "throughput": float(len(times) / np.sum(times)) if np.sum(times) > 0 else None}
+    for p in PERCENTILES:
+        result["p" + str(p)] = float(np.percentile(times, p))
+    return result
+
+# key telling apart the configurations of a results file
+def configuration(result):
+    return (result["size"], result["backend"], result["encoding"], result["operation"])
+
+def describe(result):
+    return (str(result["size"]) + "x" + str(result["size"]) + " " + result["backend"]
+            + " " + result["encoding"] + " " + result["operation"])
+
+# runs every configuration on every corpus (of one of sizes if it is not
+# None) and writes the results in the JSON file output
+# dlx does not use any encoding, it only runs once per operation
+def run(corpora, sizes, names, encodings, operations, count, warmup, repeats, output):
+    results = []
+    for corpus in corpora:
+        sudokus, solutions = load_corpus(corpus, count)
+        if sudokus == [] or (sizes is not None and not len(sudokus[0]) in sizes):
             continue
-        line = line.split("|")
-        if line[0] != '':
-            exit("illegal input: every line should start with |\n")
-        line = line[1:]
-        if line.pop() != '\n':
-            exit("illegal input\n")
-        if N == 0:
-            N = len(line)
-            if N != 4 and N != 9 and N != 16 and N != 25:
-                exit("illegal input: only size 4, 9, 16 and 25 are supported\n")
-        elif N != len(line):
-            exit("illegal input: number of columns not invariant\n")
-        line = [int(x) if x != '' and int(x) >= 0 and int(x) <= N else 0 for x in line]
-        sudoku += [line]
+        size = len(sudokus[0])
+        for name in names:
+            for encoding in (encodings if name != "dlx" else ["none"]):
+                for operation in operations:
+                    result = benchmark(sudokus, solutions, name,
+                                       encoding if name != "dlx" else "pairwise",
+                                       operation, warmup, repeats)
+                    result["encoding"] = encoding
+                    result["size"] = size
+                    result["corpus"] = os.path.basename(corpus)
+                    results.append(result)
+                    sys.stdout.write(describe(result) + ": p50 " + str(round(result["p50"], 4))
+                                     + " p95 " + str(round(result["p95"], 4))
+                                     + " p99 " + str(round(result["p99"], 4)) + " seconds, "
+                                     + str(round(result["throughput"] or 0, 2)) + " sudokus/s, "
+                                     + str(result["correct"]) + "/" + str(result["checked"])
+                                     + " correct\n")
+                    sys.stdout.flush()
+    report = {"date": time.strftime("%Y-%m-%dT%H:%M:%S"),
+              "machine": {"platform": platform.platform(), "python": platform.python_version(),
+                          "processor": platform.processor(), "cpus": os.cpu_count()},
+              "warmup": warmup, "repeats": repeats, "results": results}
+    myfile = open(output, "w")
+    json.dump(report, myfile, indent=1)
+    myfile.write("\n")
+    myfile.close()
+    return report
+
+# compares the p50 of every configuration of results to the one of baseline
+# returns the list of regressions found: configurations more than tolerance
+# (a fraction) slower, or with fewer correct solutions
+def check(results, baseline, tolerance=0.1):
+    before = {}
+    for result in baseline["results"]:
+        before[configuration(result)] = result
+    regressions = []
+    for result in results["results"]:
+        old = before.get(configuration(result))
+        if old is None:
+            continue
+        if result["p50"] > old["p50"] * (1 + tolerance):
+            regressions.append(describe(result) + ": p50 " + str(round(result["p50"], 4))
+                               + " seconds, " + str(round(old["p50"], 4)) + " in the baseline")
+        if result["correct"] < old["correct"]:
+            regressions.append(describe(result) + ": " + str(result["correct"])
+                               + " correct, " + str(old["correct"]) + " in the baseline")
+    return regressions
+
+# draws one boxplot per size, one box per configuration of the solve
+# operation (every operation if there is no solve), in directory
+def plot(results, directory):
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+    os.makedirs(directory, exist_ok=True)
+    sizes = sorted(set([result["size"] for result in results["results"]]))
+    for size in sizes:
+        entries = [result for result in results["results"] if result["size"] == size]
+        if any([result["operation"] == "solve" for result in entries]):
+            entries = [result for result in entries if result["operation"] == "solve"]
+        plt.figure()
+        plt.boxplot([result["samples"] for result in entries],
+                    labels=[result["backend"] + "\n" + result["encoding"]
+                            + ("" if result["operation"] == "solve" else "\n" + result["operation"])
+                            for result in entries])
+        plt.title("Boxplot for " + str(size) + "x" + str(size) + " sudokus")
+        plt.ylabel("Time (s)")
+        plt.savefig(os.path.join(directory, "boxplot_" + str(size) + ".png"))
+        plt.close()
+
+# sudoku of size N with a random fraction holes of its cells emptied, built
+# from the pattern solution shuffled by rng, so that any size is instant
+# it may have several solutions; with about 40% of holes or more the large
+# sizes become much harder for every backend
+def scaling_sudoku(N, holes, rng):
+    n = sudoku_block_size(N)
+    labels = [0] + rng.sample(range(1, N + 1), N)
+    lines = [band * n + i for band in rng.sample(range(n), n) for i in rng.sample(range(n), n)]
+    columns = [stack * n + j for stack in rng.sample(range(n), n) for j in rng.sample(range(n), n)]
+    # the pattern solution: cell (i, j) holds ((i mod n) n + i div n + j) mod N
+    sudoku = [[labels[((i % n) * n + i // n + j) % N + 1] for j in columns] for i in lines]
+    for cell in rng.sample(range(N * N), int(holes * N * N)):
+        sudoku[cell // N][cell % N] = 0
     return sudoku
 
-# print sudoku on stdout
-def sudoku_print(myfile, sudoku):
-    if sudoku == []:
-        myfile.write("impossible sudoku\n")
+# True if solution is a complete grid that keeps every clue of sudoku
+def valid_solution(sudoku, solution):
     N = len(sudoku)
-    for line in sudoku:
-        myfile.write("|")
-        for number in line:
-            if N > 9 and number < 10:
-                myfile.write(" ")
-            myfile.write(" " if number == 0 else str(number))
-            myfile.write("|")
-        myfile.write("\n")
-
-# get number of constraints for sudoku
-def sudoku_constraints_number(sudoku):
-    N = len(sudoku)
-    count = 4 * N * N * ( 1 + N * (N - 1) / 2)
-    for line in sudoku:
-        for number in line:
-            if number > 0:
-                count += 1
-    return count
-
-# prints the generic constraints for sudoku of size N
-def sudoku_generic_constraints(myfile, N):
-
-    def output(s):
-        myfile.write(s)
-
-    # Notice that the following function only works for N = 4 or N = 9 --> fixed
-    def newlit(i,j,k,N):
-        output(str(i*N+j) + str(k).zfill(2) + " ")
-
-    def newneglit(i,j,k,N):
-        output("-"+ str(i*N+j) + str(k).zfill(2) + " ")
-
-    def newcl():
-        output("0\n")
-
-    def newcomment(s):
-        output("")
-
-    if N == 4:
-        n = 2
-    elif N == 9:
-        n = 3
-    elif N == 16:
-        n = 4
-    elif N == 25:
-        n = 5
-    else:
-        exit("Only supports size 4, 9, 16 and 25")
-
-    # each cell contains a number
-    for i in range(0, N):
-        for j in range(0, N):   
-            for number in range(1, N+1):
-                newlit(i, j, number, N)
-            newcl()
-
-    # each cell contains at most one number
-    for i in range(0, N):
-        for j in range(0, N):
-            for number in range(1, N+1):
-                for number2 in range(number + 1, N+1):
-                    newneglit(i, j, number, N)
-                    newneglit(i, j, number2, N)
-                    newcl()
-
-    # each line contains every number once
-    for i in range(0, N):
-        for number in range(1, N+1):
-            for j in range(0, N):
-                newlit(i, j, number, N)
-            newcl()
-
-    # for each line, each number appears at most once
-    for i in range(0, N):
-        for number in range(1, N+1):
-            for j in range(0, N):
-                for j2 in range(j + 1, N):
-                    newneglit(i, j, number, N)
-                    newneglit(i, j2, number, N)
-                    newcl()
-
-    # each column contains every number once
-    for j in range(0, N):
-        for number in range(1, N+1):
-            for i in range(0, N):
-                newlit(i, j, number, N)
-            newcl()
-
-    # for each column, each number appears at most once
-    for j in range(0, N):
-        for number in range(1, N+1):
-            for i in range(0, N):
-                for i2 in range(i + 1, N):
-                    newneglit(i, j, number, N)
-                    newneglit(i2, j, number, N)
-                    newcl()
-
-    # each block contains every number once
-    for i in range(0, N, n):
-        for j in range(0, N, n):
-            for number in range(1, N+1):
-                for k in range(0, n):
-                    for l in range(0, n):
-                        newlit(i + k, j + l, number, N)
-                newcl()
-
-    # for each block, each number appears at most once
-    for i in range(0, N, n):
-        for j in range(0, N, n):
-            for number in range(1, N+1):
-                for k in range(0, n):
-                    for l in range(0, n):
-                        for k2 in range(k, n):
-                            for l2 in range(l + (k2 == k), n):
-                                newneglit(i + k, j + l, number, N)
-                                newneglit(i + k2, j + l2, number, N)
-                                newcl()
-
-def sudoku_specific_constraints(myfile, sudoku):
-
-    N = len(sudoku)
-
-    def output(s):
-        myfile.write(s)
-
-    # Notice that the following function only works for N = 4 or N = 9 --> fixed
-    def newlit(i,j,k,N):
-        output(str(i*N+j) + str(k).zfill(2) + " ")
-
-    def newcl():
-        output("0\n")
-
+    if len(solution) != N:
+        return False
+    n = sudoku_block_size(N)
+    numbers = list(range(1, N + 1))
     for i in range(N):
         for j in range(N):
-            if sudoku[i][j] > 0:
-                newlit(i, j, sudoku[i][j], N)
-                newcl()
-
-def sudoku_other_solution_constraint(myfile, sudoku):
-    # simply add a constraint that forbids the current solution
-    for i in range(len(sudoku)):
-        for j in range(len(sudoku)):
-            if sudoku[i][j] > 0:
-                myfile.write("-" + str(i*len(sudoku)+j) + str(sudoku[i][j]).zfill(2) + " ")
-    myfile.write("0\n")
-
-def sudoku_solve(filename):
-    command = "java -jar org.sat4j.core.jar sudoku.cnf"
-    process = subprocess.Popen(command, shell=True,
-                               stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-    out, err = process.communicate()
-    for line in out.split(b'\n'):
-        line = line.decode("utf-8")
-        if line == "" or line[0] == 'c':
-            continue
-        if line[0] == 's':
-            if line != 's SATISFIABLE':
-                return []
-            continue
-        if line[0] == 'v':
-            line = line[2:]
-            units = line.split()
-            if units.pop() != '0':
-                exit("strange output from SAT solver:" + line + "\n")
-            units = [int(x) for x in units if int(x) >= 0]
-            N = len(units)
-            if N == 16:
-                N = 4
-            elif N == 81:
-                N = 9
-            elif N == 256:
-                N = 16
-            elif N == 625:
-                N = 25
-            else:
-                exit("strange output from SAT solver:" + line + "\n")
-            sudoku = [ [0 for i in range(N)] for j in range(N)]
-            # Notice that the following function only works for N = 4 or N = 9 --> fixed
-            for number in units:
-                # isolate last two digits
-                value = number % 100
-                number = number // 100
-                # isolate last digit
-                j = number % N
-                number = number // N
-                # isolate first digit
-                i = number
-                sudoku[i][j] = value
-            return sudoku
-        exit("strange output from SAT solver:" + line + "\n")
-        return []
-
-def sudoku_generate(size, cm):
-    sudoku = [[0 for i in range(size)] for j in range(size)]
-
-    # generate a first batch of 9 clues that wont create a contradiction to create some kind of random seed for the SAT solver
-    for k in range(1,size+1):
-        i = int(random() * size)
-        j = int(random() * size)
-        sudoku[i][j] = k
-
-    # solve the sudoku with this kind of random seed
-    myfile = open("sudoku.cnf", "w")
-    myfile.write("p cnf "+ str(size*size) + str(size).zfill(2)  +" "+
-                str(sudoku_constraints_number(sudoku))+"\n")
-    sudoku_generic_constraints(myfile, size)
-    sudoku_specific_constraints(myfile, sudoku)
+            if sudoku[i][j] > 0 and solution[i][j] != sudoku[i][j]:
+                return False
+    groups = [line for line in solution] + [list(column) for column in zip(*solution)]
+    groups += [[solution[bi + k][bj + l] for k in range(n) for l in range(n)]
+               for bi in range(0, N, n) for bj in range(0, N, n)]
+    return all([sorted(group) == numbers for group in groups])
+
+# for every size of sizes, times the template of the generic constraints,
+# the encoding of a sudoku (built by scaling_sudoku) and its solving with the
+# backend name, and measures the CNF, then writes the results in the JSON
+# file output
+def scale(sizes, name, encoding, holes, seed, output):
+    METRICS.enabled = True
+    rng = Random(seed)
+    backend = make_backend(name)
+    results = []
+    for N in sizes:
+        sudoku = scaling_sudoku(N, holes, rng)
+        varmap = ReducedVarMap(sudoku) if encoding == "reduced" else VarMap(N, encoding)
+        result = {"size": N, "backend": name, "encoding": encoding,
+                  "clues": sum([1 for line in sudoku for number in line if number > 0])}
+        # built once per size and encoding, then only copied
+        start = time.monotonic()
+        if encoding == "reduced":
+            result["variables"] = varmap.nvars
+        else:
+            sudoku_template(varmap)
+            result["variables"] = sudoku_generic_clauses(N, encoding).nvars
+        result["template_seconds"] = time.monotonic() - start
+        METRICS.reset()
+        start = time.monotonic()
+        sudoku_dump_cnf(io.BytesIO(), sudoku, varmap)
+        result["encode_seconds"] = time.monotonic() - start
+        result.update(METRICS.counters)
+        METRICS.reset()
+        start = time.monotonic()
+        solution = backend.solve(sudoku, varmap)
+        result["solve_seconds"] = time.monotonic() - start
+        result["solver_seconds"] = METRICS.phases.get("solve", 0)
+        result["solved"] = valid_solution(sudoku, solution)
+        results.append(result)
+        sys.stdout.write(str(N) + "x" + str(N) + ": " + str(result["variables"]) + " variables, "
+                         + str(result["clauses"]) + " clauses, " + str(result["literals"])
+                         + " literals, " + str(result["cnf_bytes"]) + " CNF bytes, template "
+                         + str(round(result["template_seconds"], 4)) + " s, encoding "
+                         + str(round(result["encode_seconds"], 4)) + " s, solving "
+                         + str(round(result["solve_seconds"], 4)) + " s"
+                         + ("" if result["solved"] else " (not solved)") + "\n")
+        sys.stdout.flush()
+    backend.close()
+    myfile = open(output, "w")
+    json.dump({"date": time.strftime("%Y-%m-%dT%H:%M:%S"), "holes": holes, "seed": seed,
+               "results": results}, myfile, indent=1)
+    myfile.write("\n")
     myfile.close()
 
-    sudoku = sudoku_solve("sudoku.cnf")
-    sudoku_print(sys.stdout, sudoku)
-
-    if cm == True:
-        rand_rmv = int(random() * size) + 1
-        print("Removing " + str(rand_rmv) + " clues")
-        for i in range(len(sudoku)):
-            for j in range(len(sudoku)):
-                if sudoku[i][j] == rand_rmv:
-                    sudoku[i][j] = 0
-
-    # remove numbers from sudoku while it produces a unique solution
-    while True:
-        sudoku_print(sys.stdout, sudoku)
-        print(" ")
-        i = int(random() * size)
-        j = int(random() * size)
-        save = sudoku[i][j]
-        sudoku[i][j] = 0
-
-        # solve sudoku
-        myfile = open("sudoku.cnf", "w")
-        myfile.write("p cnf "+ str(N*N) + str(N).zfill(2)  +" "+
-                    str(sudoku_constraints_number(sudoku))+"\n")
-        sudoku_generic_constraints(myfile, size)
-        sudoku_specific_constraints(myfile, sudoku)
-        myfile.close()
-
-        sudoku_temp = sudoku_solve(sudoku)
-
-        #check if sudoku_temp produces a unique solution
-
-        myfile = open("sudoku.cnf", "a")
-        sudoku_other_solution_constraint(myfile, sudoku_temp)
-        myfile.close()
-
-        sudoku_temp = sudoku_solve(sudoku)
-
-        if sudoku_temp == []:
-            continue
-        else:
-            print("Unique sudoku found")
-            sudoku[i][j] = save
-            break
+def load_results(filename):
+    myfile = open(filename)
+    results = json.load(myfile)
+    myfile.close()
+    return results
+
+# the regressions of results, printed, exits with an error if there is one
+def report_regressions(results, baseline, tolerance):
+    regressions = check(results, baseline, tolerance)
+    for regression in regressions:
+        sys.stdout.write("regression: " + regression + "\n")
+    if regressions != []:
+        exit(str(len(regressions)) + " regression" + ("" if len(regressions) == 1 else "s") + "\n")
+    sys.stdout.write("no regression\n")
+
+# flags of run, True for the ones taking a value
+FLAGS = {}
+FLAGS["--corpora"] = True
+FLAGS["--sizes"] = True
+FLAGS["--backends"] = True
+FLAGS["--encodings"] = True
+FLAGS["--operations"] = True
+FLAGS["--count"] = True
+FLAGS["--warmup"] = True
+FLAGS["--repeats"] = True
+FLAGS["--output"] = True
+FLAGS["--baseline"] = True
+FLAGS["--tolerance"] = True
+
+# flags of scale
+SCALE_FLAGS = {}
+SCALE_FLAGS["--sizes"] = True
+SCALE_FLAGS["--backend"] = True
+SCALE_FLAGS["--encoding"] = True
+SCALE_FLAGS["--holes"] = True
+SCALE_FLAGS["--seed"] = True
+SCALE_FLAGS["--output"] = True
+
+def usage():
+    sys.stdout.write("./script.py run [flags]: benchmarks every configuration on every corpus\n")
+    sys.stdout.write("     where [flags] can be\n")
+    sys.stdout.write("  --corpora <dir,...>: corpora to use, every sudoku<N>x<N> directory by default\n")
+    sys.stdout.write("  --sizes <N,...>: only the corpora of these sizes\n")
+    sys.stdout.write("  --backends <name,...>: " + ", ".join(BACKENDS) + " (all by default)\n")
+    sys.stdout.write("  --encodings <name,...>: " + ", ".join(ENCODINGS) + " (pairwise by default)\n")
+    sys.stdout.write("  --operations <name,...>: " + ", ".join(OPERATIONS) + " (solve by default)\n")
+    sys.stdout.write("  --count <K>: only the first <K> sudokus of each corpus\n")
+    sys.stdout.write("  --warmup <W>: sudokus solved before timing, 1 by default\n")
+    sys.stdout.write("  --repeats <R>: times each sudoku is timed, 3 by default\n")
+    sys.stdout.write("  --output <file>.json: results file, benchmark.json by default\n")
+    sys.stdout.write("  --baseline <file>.json: then check the results against this baseline\n")
+    sys.stdout.write("  --tolerance <fraction>: (--baseline) slowdown allowed, 0.1 by default\n")
+    sys.stdout.write("./script.py check <results>.json <baseline>.json [tolerance]: fails if a\n")
+    sys.stdout.write("                    configuration got slower than in baseline\n")
+    sys.stdout.write("./script.py plot <results>.json [directory]: boxplots, in report/figs by default\n")
+    sys.stdout.write("./script.py scale [flags]: encoding time, CNF size and solving time by size\n")
+    sys.stdout.write("     where [flags] can be\n")
+    sys.stdout.write("  --sizes <N,...>: perfect squares, 4,9,16,25,36,49,64 by default\n")
+    sys.stdout.write("  --backend <name>: " + ", ".join(BACKENDS) + " (sat4j by default)\n")
+    sys.stdout.write("  --encoding <name>: " + ", ".join(ENCODINGS) + " (sequential by\n")
+    sys.stdout.write("                    default, pairwise needs O(N^4) clauses)\n")
+    sys.stdout.write("  --holes <fraction>: cells emptied, 0.3 by default (around 0.4 the large\n")
+    sys.stdout.write("                    sizes get much harder)\n")
+    sys.stdout.write("  --seed <integer>: seed of the sudokus, 0 by default\n")
+    sys.stdout.write("  --output <file>.json: results file, scale.json by default\n")
+    exit("Bad arguments\n")
+
+# the flags of args that are keys of allowed, each followed by its value,
+# parsed like the ones of sudokub.py
+def read_flags(args, allowed):
+    flags = parse_flags(args, allowed)
+    if flags is None:
+        usage()
+    return flags
 
-    return sudoku
-    
 if __name__ == "__main__":
-    save = open("output.txt", "w")
-    save.write("Results for sudokub.py\n")
-    save.write("Tested on MacBook Pro 2019 Intel i5\n")
-    times_9 = np.zeros(100)
-    correct = 0
-    wrong = 0
-
-    for i in range(100):
-        # start a chrono
-        start = time.time()
-        file = "sudoku9x9/sudoku" + str(i).zfill(2) + ".txt"
-        sudoku = sudoku_read(file)
-        N = len(sudoku)
-        myfile = open("sudoku.cnf", "w")
-        myfile.write("p cnf "+ str(N*N) + str(N).zfill(2)  +" "+
-                    str(sudoku_constraints_number(sudoku))+"\n")
-        sudoku_generic_constraints(myfile, N)
-        sudoku_specific_constraints(myfile, sudoku)
-        myfile.close()
-        sudoku = sudoku_solve("sudoku.cnf")
-
-        checkfile = "sudoku9x9-sol/sudoku" + str(i).zfill(2) + ".txt"
-        check = sudoku_read(checkfile)
-
-        # stop chrono
-        end = time.time()
-        times_9[i] = end - start
-
-        if sudoku == check:
-            #print("\033[92m" + "Sudoku " + str(i).zfill(2) + " is correct in " + str(times[i]) + " seconds" + "\033[0m")
-            correct += 1
-        else:
-            #print("\033[91m" + "Sudoku " + str(i).zfill(2) + " is incorrect in " + str(times[i]) + " seconds" + "\033[0m")
-            wrong += 1
-
-    save.write("\n### 9x9 ###\n")
-    save.write("Correct: " + str(correct) + "\n")
-    save.write("Wrong: " + str(wrong) + "\n")
-    save.write("Average time: " + str(np.mean(times_9)) + " seconds" + "\n")
-    save.write("Standard deviation: " + str(np.std(times_9)) + " seconds" + "\n")
-    save.write("Maximum time: " + str(np.max(times_9)) + " seconds" + "\n")
-    save.write("Minimum time: " + str(np.min(times_9)) + " seconds" + "\n")
-
-    # plot boxplot for times_9
-    plt.figure()
-    plt.boxplot(times_9)
-    plt.title("Boxplot for 9x9 sudokus")
-    plt.ylabel("Time (s)")
-    plt.savefig("report/figs/boxplot_9.png")
-
-    times_16 = np.zeros(10)
-    correct = 0
-    wrong = 0
-
-    for i in range(10):
-        # start a chrono
-        start = time.time()
-        file = "sudoku16x16/sudoku" + str(i).zfill(2) + ".txt"
-        sudoku = sudoku_read(file)
-        N = len(sudoku)
-        myfile = open("sudoku.cnf", "w")
-        myfile.write("p cnf "+ str(N*N) + str(N).zfill(2)  +" "+
-                    str(sudoku_constraints_number(sudoku))+"\n")
-        sudoku_generic_constraints(myfile, N)
-        sudoku_specific_constraints(myfile, sudoku)
-        myfile.close()
-        sudoku = sudoku_solve("sudoku.cnf")
-
-        checkfile = "sudoku16x16-sol/sudoku" + str(i).zfill(2) + ".txt"
-        check = sudoku_read(checkfile)
-
-        # stop chrono
-        end = time.time()
-        times_16[i] = end - start
-
-        if sudoku == check:
-            #print("\033[92m" + "Sudoku " + str(i).zfill(2) + " is correct in " + str(times[i]) + " seconds" + "\033[0m")
-            correct += 1
-        else:
-            #print("\033[91m" + "Sudoku " + str(i).zfill(2) + " is incorrect in " + str(times[i]) + " seconds" + "\033[0m")
-            wrong += 1
-
-    save.write("\n### 16x16 ###\n")
-    save.write("Correct: " + str(correct) + "\n")
-    save.write("Wrong: " + str(wrong) + "\n")
-    save.write("Average time: " + str(np.mean(times_16)) + " seconds" + "\n")
-    save.write("Standard deviation: " + str(np.std(times_16)) + " seconds" + "\n")
-    save.write("Maximum time: " + str(np.max(times_16)) + " seconds" + "\n")
-    save.write("Minimum time: " + str(np.min(times_16)) + " seconds" + "\n")
-    
-    # plot boxplot for times_16
-    plt.figure()
-    plt.boxplot(times_16)
-    plt.title("Boxplot for 16x16 sudokus")
-    plt.ylabel("Time (s)")
-    plt.savefig("report/figs/boxplot_16.png")
-    
-    times_25 = np.zeros(4)
-    correct = 0
-    wrong = 0
-
-    for i in range(4):
-        # start a chrono
-        start = time.time()
-        file = "sudoku25x25/sudoku" + str(i).zfill(2) + ".txt"
-        sudoku = sudoku_read(file)
-        N = len(sudoku)
-        myfile = open("sudoku.cnf", "w")
-        myfile.write("p cnf "+ str(N*N) + str(N).zfill(2)  +" "+
-                    str(sudoku_constraints_number(sudoku))+"\n")
-        sudoku_generic_constraints(myfile, N)
-        sudoku_specific_constraints(myfile, sudoku)
-        myfile.close()
-        sudoku = sudoku_solve("sudoku.cnf")
-
-        checkfile = "sudoku25x25-sol/sudoku" + str(i).zfill(2) + ".txt"
-        check = sudoku_read(checkfile)
-
-        # stop chrono
-        end = time.time()
-        times_25[i] = end - start
-
-        if sudoku == check:
-            #print("\033[92m" + "Sudoku " + str(i).zfill(2) + " is correct in " + str(times[i]) + " seconds" + "\033[0m")
-            correct += 1
+    if len(sys.argv) >= 2 and sys.argv[1] == "run":
+        flags = read_flags(sys.argv[2:], FLAGS)
+        names = flags["--backends"].split(",") if "--backends" in flags else list(BACKENDS)
+        encodings = flags.get("--encodings", "pairwise").split(",")
+        operations = flags.get("--operations", "solve").split(",")
+        if (not all([name in BACKENDS for name in names])
+                or not all([encoding in ENCODINGS for encoding in encodings])
+                or not all([operation in OPERATIONS for operation in operations])):
+            usage()
+        if "--corpora" in flags:
+            corpora = flags["--corpora"].split(",")
         else:
-            #print("\033[91m" + "Sudoku " + str(i).zfill(2) + " is incorrect in " + str(times[i]) + " seconds" + "\033[0m")
-            wrong += 1
-
-    save.write("\n### 25x25 ###\n")
-    save.write("Correct: " + str(correct) + "\n")
-    save.write("Wrong: " + str(wrong) + "\n")
-    save.write("Average time: " + str(np.mean(times_25)) + " seconds" + "\n")
-    save.write("Standard deviation: " + str(np.std(times_25)) + " seconds" + "\n")
-    save.write("Maximum time: " + str(np.max(times_25)) + " seconds" + "\n")
-    save.write("Minimum time: " + str(np.min(times_25)) + " seconds" + "\n")
-
-    save.close()
-
-    # plot boxplot for times_25
-    plt.figure()
-    plt.boxplot(times_25)
-    plt.title("Boxplot for 25x25 sudokus")
-    plt.ylabel("Time (s)")
-    plt.savefig("report/figs/boxplot_25.png")
-
-
-
-    
\ No newline at end of file
+            corpora = discover_corpora()
+        sizes = [int(size) for size in flags["--sizes"].split(",")] if "--sizes" in flags else None
+        results = run(corpora, sizes, names, encodings, operations,
+                      int(flags["--count"]) if "--count" in flags else None,
+                      int(flags.get("--warmup", 1)), int(flags.get("--repeats", 3)),
+                      flags.get("--output", "benchmark.json"))
+        if "--baseline" in flags:
+            report_regressions(results, load_results(flags["--baseline"]),
+                               float(flags.get("--tolerance", 0.1)))
+    elif len(sys.argv) >= 2 and sys.argv[1] == "scale":
+        flags = read_flags(sys.argv[2:], SCALE_FLAGS)
+        sizes = [int(size) for size in flags.get("--sizes", "4,9,16,25,36,49,64").split(",")]
+        if (not all([sudoku_valid_size(size) for size in sizes])
+                or not flags.get("--backend", "sat4j") in BACKENDS
+                or not flags.get("--encoding", "sequential") in ENCODINGS):
+            usage()
+        scale(sizes, flags.get("--backend", "sat4j"), flags.get("--encoding", "sequential"),
+              float(flags.get("--holes", 0.3)), int(flags.get("--seed", 0)),
+              flags.get("--output", "scale.json"))
+    elif len(sys.argv) in [4, 5] and sys.argv[1] == "check":
+        report_regressions(load_results(sys.argv[2]), load_results(sys.argv[3]),
+                           float(sys.argv[4]) if len(sys.argv) == 5 else 0.1)
+    elif len(sys.argv) in [3, 4] and sys.argv[1] == "plot":
+        plot(load_results(sys.argv[2]),
+             sys.argv[3] if len(sys.argv) == 4 else os.path.join(HERE, "report", "figs"))
+    else:
+        usage()
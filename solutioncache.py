@@ -0,0 +1,200 @@
+#!/usr/bin/python3
+
+# persistent cache of the solutions of sudokus, in an SQLite file, shared by
+# every run (and every process of a batch) using the same file
+# sudokus are keyed by a canonical form: equivalent sudokus (relabelled
+# numbers, lines swapped within a band, columns within a stack, bands,
+# stacks, transposed) mostly get the same key, and the cached solutions are
+# turned back through the transformation instead of solving again
+# the least recently used entries are evicted once there are more than
+# capacity of them
+#
+# ./solutioncache.py <file>: prints the number of entries and the counters
+# of a cache
+
+import os
+import sys
+import time
+import sqlite3
+
+# colour refinement rounds used to order lines and columns
+ROUNDS = 3
+
+# ranks of the values of signatures, equal signatures get equal ranks
+def _ranks(signatures):
+    rank = {}
+    for signature in sorted(set(signatures)):
+        rank[signature] = len(rank)
+    return [rank[signature] for signature in signatures]
+
+# order of the lines of grid: lines sorted within their band and bands sorted,
+# by signatures that do not depend on the symmetries, and the same for the
+# columns
+# ties keep the original order, so an equivalent sudoku may get another key
+# but the key always is a transformation of grid
+def _order(grid, N, n):
+    freq = [0] * (N + 1)
+    for line in grid:
+        for number in line:
+            freq[number] += 1
+    rows = _ranks([N - list(line).count(0) for line in grid])
+    columns = _ranks([sum([1 for i in range(N) if grid[i][j] > 0]) for j in range(N)])
+    for r in range(ROUNDS):
+        rows, columns = (
+            _ranks([tuple(sorted([(columns[j], freq[grid[i][j]]) for j in range(N) if grid[i][j] > 0]))
+                    for i in range(N)]),
+            _ranks([tuple(sorted([(rows[i], freq[grid[i][j]]) for i in range(N) if grid[i][j] > 0]))
+                    for j in range(N)]))
+
+    def arrange(colour):
+        groups = [sorted(range(b * n, b * n + n), key=lambda x: colour[x]) for b in range(n)]
+        groups.sort(key=lambda group: [colour[x] for x in group])
+        return [x for group in groups for x in group]
+
+    return arrange(rows), arrange(columns)
+
+# cells as bytes, one per cell up to size 255 and two (big-endian) above
+def _pack(cells, N):
+    if N < 256:
+        return bytes(cells)
+    return b"".join([cell.to_bytes(2, "big") for cell in cells])
+
+def _unpack(data, N):
+    if N < 256:
+        return list(data)
+    return [int.from_bytes(data[i:i + 2], "big") for i in range(0, len(data), 2)]
+
+# bytes taken by a grid of size N
+def _record(N):
+    return N * N * (1 if N < 256 else 2)
+
+# returns (key, transform) for sudoku, where transform turns solutions of
+# sudoku into solutions of the canonical sudoku and back
+# the key starts with N, a 0 followed by N on two bytes above size 255
+def canonical_form(sudoku):
+    N = len(sudoku)
+    n = int(round(N ** 0.5))
+    best = None
+    for transpose in [False, True]:
+        grid = [list(line) for line in zip(*sudoku)] if transpose else sudoku
+        rows, columns = _order(grid, N, n)
+        # numbers relabelled in the order they first appear
+        labels = [0] * (N + 1)
+        count = 0
+        cells = []
+        for i in rows:
+            for j in columns:
+                number = grid[i][j]
+                if number > 0 and labels[number] == 0:
+                    count += 1
+                    labels[number] = count
+                cells.append(labels[number])
+        key = (bytes([N]) if N < 256 else b"\0" + N.to_bytes(2, "big")) + _pack(cells, N)
+        if best is None or key < best[0]:
+            # the numbers missing from sudoku get the labels left
+            for number in range(1, N + 1):
+                if labels[number] == 0:
+                    count += 1
+                    labels[number] = count
+            best = (key, (transpose, rows, columns, labels))
+    return best
+
+# solution of sudoku turned into the matching solution of its canonical form
+def to_canonical(solution, transform):
+    transpose, rows, columns, labels = transform
+    grid = [list(line) for line in zip(*solution)] if transpose else solution
+    return [[labels[grid[i][j]] for j in columns] for i in rows]
+
+# solution of the canonical form turned back into a solution of the sudoku
+# transform was computed for
+def from_canonical(solution, transform):
+    transpose, rows, columns, labels = transform
+    N = len(solution)
+    numbers = [0] * (N + 1)
+    for number in range(1, N + 1):
+        numbers[labels[number]] = number
+    grid = [[0] * N for i in range(N)]
+    for a in range(N):
+        for b in range(N):
+            grid[rows[a]][columns[b]] = numbers[solution[a][b]]
+    return [list(line) for line in zip(*grid)] if transpose else grid
+
+class SolutionCache:
+    def __init__(self, filename, capacity=100000):
+        self.capacity = capacity
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.db = sqlite3.connect(filename, timeout=60)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        # exhaustive is 1 when every solution of the sudoku is stored
+        self.db.execute("CREATE TABLE IF NOT EXISTS solutions (key BLOB PRIMARY KEY, "
+                        "solutions BLOB, exhaustive INTEGER, used REAL)")
+        self.db.execute("CREATE INDEX IF NOT EXISTS solutions_used ON solutions (used)")
+        self.db.execute("CREATE TABLE IF NOT EXISTS counters (name TEXT PRIMARY KEY, value INTEGER)")
+        self.db.commit()
+
+    def _count(self, name, value=1):
+        setattr(self, name, getattr(self, name) + value)
+        self.db.execute("INSERT INTO counters VALUES (?, ?) ON CONFLICT(name) "
+                        "DO UPDATE SET value = value + ?", (name, value, value))
+
+    # returns up to limit solutions of sudoku, None if the cache cannot tell
+    def lookup(self, sudoku, limit):
+        key, transform = canonical_form(sudoku)
+        row = self.db.execute("SELECT solutions, exhaustive FROM solutions WHERE key = ?",
+                              (key,)).fetchone()
+        N = len(sudoku)
+        if row is None or (len(row[0]) < limit * _record(N) and not row[1]):
+            self._count("misses")
+            self.db.commit()
+            return None
+        self._count("hits")
+        self.db.execute("UPDATE solutions SET used = ? WHERE key = ?", (time.time(), key))
+        self.db.commit()
+        cells = row[0]
+        found = []
+        for start in range(0, min(len(cells), limit * _record(N)), _record(N)):
+            grid = _unpack(cells[start:start + _record(N)], N)
+            solution = [grid[i * N:i * N + N] for i in range(N)]
+            found.append(from_canonical(solution, transform))
+        return found
+
+    # stores the solutions of sudoku found by a search for up to limit of them
+    def store(self, sudoku, solutions, limit):
+        key, transform = canonical_form(sudoku)
+        cells = _pack([number for solution in solutions
+                       for line in to_canonical(solution, transform) for number in line],
+                      len(sudoku))
+        self.db.execute("INSERT OR REPLACE INTO solutions VALUES (?, ?, ?, ?)",
+                        (key, cells, int(len(solutions) < limit), time.time()))
+        extra = self.db.execute("SELECT COUNT(*) FROM solutions").fetchone()[0] - self.capacity
+        if extra > 0:
+            self.db.execute("DELETE FROM solutions WHERE key IN "
+                            "(SELECT key FROM solutions ORDER BY used LIMIT ?)", (extra,))
+            self._count("evictions", extra)
+        self.db.commit()
+
+    # counters of every run that used the file
+    def totals(self):
+        totals = {"hits": 0, "misses": 0, "evictions": 0}
+        for (name, value) in self.db.execute("SELECT name, value FROM counters"):
+            totals[name] = value
+        return totals
+
+    def __len__(self):
+        return self.db.execute("SELECT COUNT(*) FROM solutions").fetchone()[0]
+
+    def close(self):
+        self.db.close()
+
+if __name__ == "__main__":
+    if len(sys.argv) != 2 or not os.path.exists(sys.argv[1]):
+        sys.stdout.write("./solutioncache.py <file>\n")
+        exit("Bad arguments\n")
+    cache = SolutionCache(sys.argv[1])
+    totals = cache.totals()
+    sys.stdout.write(str(len(cache)) + " entries, " + str(totals["hits"]) + " hits, "
+                     + str(totals["misses"]) + " misses, "
+                     + str(totals["evictions"]) + " evictions\n")
+    cache.close()
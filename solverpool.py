@@ -0,0 +1,174 @@
+#!/usr/bin/python3
+
+# pool of long-lived SAT solver processes fed over pipes, so that starting a
+# solver (a JVM for SAT4J) is paid once per worker and not once per CNF
+# a CNF is sent as a line holding its size in bytes followed by the DIMACS
+# text, the worker answers like SAT4J ("s ..." and "v ..." lines) followed by
+# a "c end" line
+# workers that crash or do not answer in time are restarted
+#
+# ./solverpool.py runs a worker using the in-process cdcl.CDCLSolver
+
+import os
+import sys
+import time
+import queue
+import select
+import subprocess
+
+import cdcl
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+SAT4J_JAR = os.path.join(HERE, "org.sat4j.core.jar")
+SAT4J_CLASSES = os.path.join(HERE, "build")
+
+# command starting a SAT4J worker, Sat4jWorker.java is compiled on first use
+def sat4j_worker_command():
+    if not os.path.exists(os.path.join(SAT4J_CLASSES, "Sat4jWorker.class")):
+        os.makedirs(SAT4J_CLASSES, exist_ok=True)
+        try:
+            subprocess.run(["javac", "-cp", SAT4J_JAR, "-d", SAT4J_CLASSES,
+                            os.path.join(HERE, "Sat4jWorker.java")], check=True)
+        except (OSError, subprocess.CalledProcessError):
+            exit("cannot compile Sat4jWorker.java, a JDK is needed\n")
+    return ["java", "-cp", SAT4J_JAR + os.pathsep + SAT4J_CLASSES, "Sat4jWorker"]
+
+# command starting a worker running cdcl.CDCLSolver
+def cdcl_worker_command():
+    return [sys.executable, os.path.abspath(__file__)]
+
+WORKER_COMMANDS = {}
+WORKER_COMMANDS["sat4j"] = sat4j_worker_command
+WORKER_COMMANDS["cdcl"] = cdcl_worker_command
+
+class Worker:
+    def __init__(self, command):
+        self.command = command
+        self.process = None
+        self.start()
+
+    def start(self):
+        self.process = subprocess.Popen(self.command, stdin=subprocess.PIPE,
+                                        stdout=subprocess.PIPE)
+
+    def stop(self):
+        if self.process.poll() is None:
+            self.process.kill()
+        self.process.wait()
+
+    def restart(self):
+        self.stop()
+        self.start()
+
+    # returns the lines of the answer to cnf (bytes), None if the worker
+    # crashed or did not answer within timeout seconds
+    def query(self, cnf, timeout=None):
+        try:
+            self.process.stdin.write(str(len(cnf)).encode() + b"\n")
+            self.process.stdin.write(cnf)
+            self.process.stdin.flush()
+        except (BrokenPipeError, OSError):
+            return None
+        deadline = None if timeout is None else time.monotonic() + timeout
+        fd = self.process.stdout.fileno()
+        chunks = []
+        tail = b""
+        while not tail.endswith(b"c end\n"):
+            wait = None if deadline is None else deadline - time.monotonic()
+            if wait is not None and wait <= 0:
+                return None
+            ready, _, _ = select.select([fd], [], [], wait)
+            if not ready:
+                return None
+            chunk = os.read(fd, 1 << 16)
+            if chunk == b"":
+                return None
+            chunks.append(chunk)
+            tail = (tail + chunk)[-6:]
+        return b"".join(chunks).decode("utf-8").split("\n")
+
+class SolverPool:
+    # size workers started with command (a list), each query may take at most
+    # timeout seconds before its worker is considered hung
+    def __init__(self, command, size=1, timeout=None):
+        self.timeout = timeout
+        self.workers = [Worker(command) for i in range(size)]
+        self.idle = queue.Queue()
+        for worker in self.workers:
+            self.idle.put(worker)
+
+    # returns the answer of an idle worker to cnf, waiting for one if they are
+    # all busy; a failed query is retried once on a restarted worker, None is
+    # returned if it fails again
+    def solve(self, cnf):
+        worker = self.idle.get()
+        try:
+            for attempt in range(2):
+                lines = worker.query(cnf, self.timeout)
+                if lines is not None:
+                    return lines
+                worker.restart()
+            return None
+        finally:
+            self.idle.put(worker)
+
+    def close(self):
+        for worker in self.workers:
+            try:
+                worker.process.stdin.close()
+            except OSError:
+                pass
+            worker.stop()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+# reads the clauses of a DIMACS CNF (bytes)
+def read_dimacs(cnf):
+    clauses = []
+    clause = []
+    nvars = 0
+    for line in cnf.split(b"\n"):
+        if line == b"" or line[:1] == b"c":
+            continue
+        if line[:1] == b"p":
+            nvars = int(line.split()[2])
+            continue
+        for lit in line.split():
+            lit = int(lit)
+            if lit == 0:
+                clauses.append(clause)
+                clause = []
+            else:
+                clause.append(lit)
+    return nvars, clauses
+
+# worker loop of cdcl_worker_command
+def cdcl_worker():
+    stdin = sys.stdin.buffer
+    stdout = sys.stdout.buffer
+    while True:
+        line = stdin.readline()
+        if line == b"":
+            break
+        nvars, clauses = read_dimacs(stdin.read(int(line)))
+        solver = cdcl.CDCLSolver(nvars)
+        for clause in clauses:
+            solver.add_clause(clause)
+        model = solver.solve()
+        if model is None:
+            stdout.write(b"s UNSATISFIABLE\n")
+        else:
+            stdout.write(b"s SATISFIABLE\nv " + " ".join([str(lit) for lit in model]).encode() + b" 0\n")
+        # statistics named as SAT4J prints them
+        for (name, value) in [("conflicts", "conflicts"), ("decisions", "decisions"),
+                              ("propagations", "propagations"), ("starts", "restarts")]:
+            stdout.write(("c " + name + " : " + str(solver.stats[value]) + "\n").encode())
+        stdout.write(b"c end\n")
+        stdout.flush()
+
+if __name__ == "__main__":
+    cdcl_worker()
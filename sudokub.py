@@ -1,8 +1,30 @@
 #!/usr/bin/python3
 
+import io
+import os
 import sys
+import glob
+import math
+import bisect
+import atexit
+import cProfile
+import mmap
+import time
+import signal
 import subprocess
-from random import random
+import multiprocessing
+import multiprocessing.connection
+import concurrent.futures
+from random import Random
+
+import cdcl
+import dlx
+import solverpool
+from grid import to_grid
+from presolve import presolve, presolved
+from solutioncache import SolutionCache
+from metrics import METRICS, sat4j_statistic, cdcl_statistics
+from clausestore import ClauseStore, AMO_ENCODINGS, exactly_one_blocks
 
 # reads a sudoku from file
 # columns are separated by |, lines by newlines
@@ -12,6 +34,7 @@ from random import random
 # | | |2| |
 # | |2| | |
 # spaces and empty lines are ignored
+# any size N that is a perfect square is supported
 
 def sudoku_read(filename):
     myfile = open(filename, 'r')
@@ -29,8 +52,8 @@ def sudoku_read(filename):
             exit("illegal input\n")
         if N == 0:
             N = len(line)
-            if N != 4 and N != 9 and N != 16 and N != 25:
-                exit("illegal input: only size 4, 9, 16 and 25 are supported\n")
+            if not sudoku_valid_size(N):
+                exit("illegal input: the size should be a perfect square (4, 9, 16, 25, 36, ...)\n")
         elif N != len(line):
             exit("illegal input: number of columns not invariant\n")
         line = [int(x) if x != '' and int(x) >= 0 and int(x) <= N else 0 for x in line]
@@ -38,163 +61,526 @@ def sudoku_read(filename):
     return sudoku
 
 # print sudoku on stdout
+# every cell is as wide as the largest number
 def sudoku_print(myfile, sudoku):
-    if sudoku == []:
+    if len(sudoku) == 0:
         myfile.write("impossible sudoku\n")
     N = len(sudoku)
+    width = len(str(N))
     for line in sudoku:
         myfile.write("|")
         for number in line:
-            if N > 9 and number < 10:
-                myfile.write(" ")
-            myfile.write(" " if number == 0 else str(number))
+            myfile.write(("" if number == 0 else str(number)).rjust(width))
             myfile.write("|")
         myfile.write("\n")
 
-# get number of constraints for sudoku
-def sudoku_constraints_number(sudoku):
-    N = len(sudoku)
-    count = 4 * N * N * ( 1 + N * (N - 1) / 2)
-    for line in sudoku:
-        for number in line:
-            if number > 0:
-                count += 1
-    return count
+# dense numbering of the variables of a sudoku of size N
+# "cell (i, j) contains number k" (0 <= i, j < N, 1 <= k <= N) is variable
+# (i*N + j)*N + k, so the cell variables are exactly 1..N^3
+# amo is the at-most-one encoding of the generic constraints (a key of
+# clausestore.AMO_ENCODINGS), whose auxiliary variables are numbered above N^3
+# every encoder and decoder goes through this mapping
+class VarMap:
+    def __init__(self, N, amo="pairwise"):
+        self.N = N
+        self.amo = amo
+        self.count = N * N * N
 
-# prints the generic constraints for sudoku of size N
-def sudoku_generic_constraints(myfile, N):
+    def encode(self, i, j, k):
+        return (i * self.N + j) * self.N + k
 
-    def output(s):
-        myfile.write(s)
+    # returns (i, j, k) for a cell variable, None for any other variable
+    def decode(self, var):
+        if var < 1 or var > self.count:
+            return None
+        var -= 1
+        k = var % self.N + 1
+        var //= self.N
+        return var // self.N, var % self.N, k
 
-    # Notice that the following function only works for N = 4 or N = 9 --> fixed
-    def newlit(i,j,k,N):
-        output(str(i*N+j) + str(k).zfill(2) + " ")
+    # the grid the decoded variables are written into
+    def grid(self):
+        return [[0 for i in range(self.N)] for j in range(self.N)]
 
-    def newneglit(i,j,k,N):
-        output("-"+ str(i*N+j) + str(k).zfill(2) + " ")
+# True if N is the size of a sudoku, a perfect square
+def sudoku_valid_size(N):
+    return N >= 1 and math.isqrt(N) ** 2 == N
 
-    def newcl():
-        output("0\n")
+# side of the blocks of a sudoku of size N
+def sudoku_block_size(N):
+    if not sudoku_valid_size(N):
+        exit("the size of a sudoku should be a perfect square (4, 9, 16, 25, 36, ...)\n")
+    return math.isqrt(N)
 
-    def newcomment(s):
-        output("")
+# numbering of the variables left once the clues of sudoku are applied
+# clue cells get no variable and neither do the numbers a clue already
+# eliminates from a cell, the remaining candidates are numbered 1..count
+# the groups left are small, they are always encoded pairwise
+# domains, candidate bitmasks as given by presolve.presolve, may remove more
+# candidates
+class ReducedVarMap(VarMap):
+    def __init__(self, sudoku, domains=None):
+        N = len(sudoku)
+        n = sudoku_block_size(N)
+        self.N = N
+        self.amo = "pairwise"
+        self.sudoku = sudoku
+        # set when two clues contradict each other
+        self.contradiction = False
+        rows = [set() for i in range(N)]
+        columns = [set() for j in range(N)]
+        blocks = [set() for b in range(N)]
+        for i in range(N):
+            for j in range(N):
+                number = sudoku[i][j]
+                if number == 0:
+                    continue
+                b = (i // n) * n + j // n
+                if number in rows[i] or number in columns[j] or number in blocks[b]:
+                    self.contradiction = True
+                rows[i].add(number)
+                columns[j].add(number)
+                blocks[b].add(number)
+        self.vars = {}
+        self.cells = [None]
+        for i in range(N):
+            for j in range(N):
+                if sudoku[i][j] > 0:
+                    continue
+                b = (i // n) * n + j // n
+                for k in range(1, N + 1):
+                    if k in rows[i] or k in columns[j] or k in blocks[b]:
+                        continue
+                    if domains is not None and not domains[i][j] >> k & 1:
+                        continue
+                    self.vars[(i * N + j) * N + k] = len(self.cells)
+                    self.cells.append((i, j, k))
+        self.count = len(self.cells) - 1
+        self.nvars = self.count
 
-    if N == 4:
-        n = 2
-    elif N == 9:
-        n = 3
-    elif N == 16:
-        n = 4
-    elif N == 25:
-        n = 5
-    else:
-        exit("Only supports size 4, 9, 16 and 25")
+    # returns None when the literal is already decided by the clues
+    def encode(self, i, j, k):
+        return self.vars.get((i * self.N + j) * self.N + k)
 
-    # each cell contains a number
-    for i in range(0, N):
-        for j in range(0, N):   
-            for number in range(1, N+1):
-                newlit(i, j, number, N)
-            newcl()
+    def decode(self, var):
+        if var < 1 or var > self.count:
+            return None
+        return self.cells[var]
 
-    # each cell contains at most one number
-    for i in range(0, N):
-        for j in range(0, N):
-            for number in range(1, N+1):
-                for number2 in range(number + 1, N+1):
-                    newneglit(i, j, number, N)
-                    newneglit(i, j, number2, N)
-                    newcl()
+    def grid(self):
+        return [list(line) for line in self.sudoku]
 
-    # each line contains every number once
-    for i in range(0, N):
-        for number in range(1, N+1):
-            for j in range(0, N):
-                newlit(i, j, number, N)
-            newcl()
+# two copies of the variables of varmap for sudoku, so that a single query
+# asks for two distinct solutions: the second copy is numbered after every
+# variable of the first one, auxiliary ones included, and is followed by one
+# "the copies differ here" variable per open cell
+# cells of the second copy are decoded N lines down, the grid holds both
+# solutions one above the other
+class PairVarMap(VarMap):
+    def __init__(self, sudoku, varmap):
+        N = varmap.N
+        self.N = N
+        self.amo = varmap.amo
+        self.first = varmap
+        self.offset = sudoku_nvars(varmap)
+        self.count = 2 * self.offset
+        self.open = [(i, j) for i in range(N) for j in range(N) if sudoku[i][j] == 0]
+        self.nvars = self.count + len(self.open)
 
-    # for each line, each number appears at most once
-    for i in range(0, N):
-        for number in range(1, N+1):
-            for j in range(0, N):
-                for j2 in range(j + 1, N):
-                    newneglit(i, j, number, N)
-                    newneglit(i, j2, number, N)
-                    newcl()
-
-    # each column contains every number once
-    for j in range(0, N):
-        for number in range(1, N+1):
-            for i in range(0, N):
-                newlit(i, j, number, N)
-            newcl()
+    def encode(self, i, j, k):
+        return self.first.encode(i, j, k)
 
-    # for each column, each number appears at most once
-    for j in range(0, N):
-        for number in range(1, N+1):
-            for i in range(0, N):
-                for i2 in range(i + 1, N):
-                    newneglit(i, j, number, N)
-                    newneglit(i2, j, number, N)
-                    newcl()
+    def decode(self, var):
+        if var < 1 or var > self.count:
+            return None
+        if var <= self.offset:
+            return self.first.decode(var)
+        cell = self.first.decode(var - self.offset)
+        if cell is None:
+            return None
+        i, j, k = cell
+        return i + self.N, j, k
 
-    # each block contains every number once
-    for i in range(0, N, n):
-        for j in range(0, N, n):
-            for number in range(1, N+1):
-                for k in range(0, n):
-                    for l in range(0, n):
-                        newlit(i + k, j + l, number, N)
-                newcl()
+    def grid(self):
+        return self.first.grid() + self.first.grid()
 
-    # for each block, each number appears at most once
-    for i in range(0, N, n):
-        for j in range(0, N, n):
-            for number in range(1, N+1):
-                for k in range(0, n):
-                    for l in range(0, n):
-                        for k2 in range(k, n):
-                            for l2 in range(l + (k2 == k), n):
-                                newneglit(i + k, j + l, number, N)
-                                newneglit(i + k2, j + l2, number, N)
-                                newcl()
+# variables of the formula over varmap, a VarMap or a ReducedVarMap, the
+# auxiliary ones included
+def sudoku_nvars(varmap):
+    if isinstance(varmap, ReducedVarMap):
+        return varmap.count
+    return sudoku_generic_clauses(varmap.N, varmap.amo).nvars
+
+# variables of several independent sudokus of the same size, solved by a
+# single query: member c of members (VarMaps or ReducedVarMaps) is numbered
+# after every variable of the members before it, from offsets[c]
+# the sudoku of a pack is its members one above the other, cells of member c
+# are decoded c*N lines down
+# stores, when given, holds the formula of each member over its own
+# variables, as output by sudoku_constraints
+class PackVarMap(VarMap):
+    def __init__(self, members, stores=None):
+        self.N = members[0].N
+        self.amo = members[0].amo
+        self.members = members
+        self.stores = stores
+        self.offsets = []
+        self.count = 0
+        for member in members:
+            self.offsets.append(self.count)
+            self.count += sudoku_nvars(member)
+        self.nvars = self.count
+
+    # the variable of member 0, as for PairVarMap
+    def encode(self, i, j, k):
+        return self.members[0].encode(i, j, k)
 
-def sudoku_specific_constraints(myfile, sudoku):
+    def decode(self, var):
+        if var < 1 or var > self.count:
+            return None
+        c = bisect.bisect_right(self.offsets, var - 1) - 1
+        cell = self.members[c].decode(var - self.offsets[c])
+        if cell is None:
+            return None
+        i, j, k = cell
+        return i + c * self.N, j, k
 
+    def grid(self):
+        return [line for member in self.members for line in member.grid()]
+
+# the encoders below hand every clause, a list of literals, to the add_clause
+# method of their output: a clausestore.ClauseStore to get a CNF file, or
+# directly an in-process solver such as cdcl.CDCLSolver
+
+# the generic constraints of each size and encoding already built
+_generic_clauses = {}
+
+# returns the generic constraints for sudoku of size N, with the at-most-one
+# encoding amo, as a ClauseStore whose nvars counts the auxiliary variables
+# built with array operations and kept for the next calls
+def sudoku_generic_clauses(N, amo="pairwise"):
+    if not (N, amo) in _generic_clauses:
+        import numpy as np
+        n = sudoku_block_size(N)
+        # the variable of "cell (i, j) contains number k" is at [i, j, k-1],
+        # numbered as by VarMap.encode
+        var = np.arange(1, N * N * N + 1, dtype=np.int32).reshape(N, N, N)
+        # each cell contains exactly one number
+        cells = var.reshape(N * N, N)
+        # each line contains every number exactly once
+        lines = var.transpose(0, 2, 1).reshape(N * N, N)
+        # each column contains every number exactly once
+        columns = var.transpose(1, 2, 0).reshape(N * N, N)
+        # each block contains every number exactly once
+        blocks = var.reshape(n, n, n, n, N).transpose(0, 2, 4, 1, 3).reshape(N * N, N)
+        store = ClauseStore()
+        next_var = N * N * N + 1
+        for groups in [cells, lines, columns, blocks]:
+            group_blocks, next_var = exactly_one_blocks(groups, next_var, amo)
+            for block in group_blocks:
+                store.add_block(block)
+        store.nvars = next_var - 1
+        _generic_clauses[(N, amo)] = store
+    return _generic_clauses[(N, amo)]
+
+# outputs the generic constraints for sudoku of size N
+# returns the number of clauses output
+def sudoku_generic_constraints(out, varmap):
+    return sudoku_generic_clauses(varmap.N, varmap.amo).add_to(out)
+
+# outputs the clues of the sudoku as unit clauses
+# returns the number of clauses output
+def sudoku_specific_constraints(out, sudoku, varmap):
+    import numpy as np
     N = len(sudoku)
+    grid = np.array(sudoku, dtype=np.int32).reshape(N, N)
+    i, j = np.nonzero(grid)
+    store = ClauseStore()
+    # numbered as by VarMap.encode
+    store.add_block(((i * N + j) * N + grid[i, j]).reshape(-1, 1))
+    return store.add_to(out)
+
+# outputs the constraints of sudoku simplified by its clues over the variables
+# of a ReducedVarMap: satisfied clauses are dropped, falsified literals are
+# removed, so only the problem over the open cells is left
+# returns the number of clauses output
+def sudoku_reduced_constraints(out, varmap):
 
-    def output(s):
-        myfile.write(s)
+    N = varmap.N
+    n = sudoku_block_size(N)
+    sudoku = varmap.sudoku
+    count = 0
 
-    # Notice that the following function only works for N = 4 or N = 9 --> fixed
-    def newlit(i,j,k,N):
-        output(str(i*N+j) + str(k).zfill(2) + " ")
+    def newcl(clause):
+        nonlocal count
+        count += 1
+        out.add_clause(clause)
 
-    def newcl():
-        output("0\n")
+    # exactly one of the literals of group is true
+    def exactly_one(group):
+        # a clue already makes one of them true, every other one is false
+        for (i, j, k) in group:
+            if sudoku[i][j] == k:
+                return
+        lits = [varmap.encode(i, j, k) for (i, j, k) in group]
+        lits = [lit for lit in lits if lit is not None]
+        # an empty clause if no candidate is left
+        newcl(lits)
+        for a in range(len(lits)):
+            for b in range(a + 1, len(lits)):
+                newcl([-lits[a], -lits[b]])
 
+    if varmap.contradiction:
+        newcl([])
+        return count
+
+    # each cell contains exactly one number
     for i in range(N):
         for j in range(N):
-            if sudoku[i][j] > 0:
-                newlit(i, j, sudoku[i][j], N)
-                newcl()
+            exactly_one([(i, j, number) for number in range(1, N+1)])
 
-def sudoku_other_solution_constraint(myfile, sudoku):
-    # simply add a constraint that forbids the current solution
+    # each line contains every number exactly once
+    for i in range(N):
+        for number in range(1, N+1):
+            exactly_one([(i, j, number) for j in range(N)])
+
+    # each column contains every number exactly once
+    for j in range(N):
+        for number in range(1, N+1):
+            exactly_one([(i, j, number) for i in range(N)])
+
+    # each block contains every number exactly once
+    for i in range(0, N, n):
+        for j in range(0, N, n):
+            for number in range(1, N+1):
+                exactly_one([(i + k, j + l, number)
+                             for k in range(n) for l in range(n)])
+
+    return count
+
+# clause forbidding the solution sudoku, over the cells that are open in
+# clues only (every cell without clues): the clue cells are the same in
+# every solution
+def sudoku_blocking_clause(sudoku, varmap, clues=None):
+    clause = []
     for i in range(len(sudoku)):
         for j in range(len(sudoku)):
-            if sudoku[i][j] > 0:
-                myfile.write("-" + str(i*len(sudoku)+j) + str(sudoku[i][j]).zfill(2) + " ")
-    myfile.write("0\n")
+            if sudoku[i][j] > 0 and (clues is None or clues[i][j] == 0):
+                # cells fixed by the clues have no variable in a reduced encoding
+                var = varmap.encode(i, j, sudoku[i][j])
+                if var is not None:
+                    clause.append(-var)
+    return clause
+
+def sudoku_other_solution_constraint(out, sudoku, varmap, clues=None):
+    # simply add a constraint that forbids the current solution
+    out.add_clause(sudoku_blocking_clause(sudoku, varmap, clues))
+    return 1
 
-def sudoku_solve(filename):
-    command = "java -jar org.sat4j.core.jar sudoku.cnf"
-    process = subprocess.Popen(command, shell=True,
+# outputs the formula of sudoku over both copies of a PairVarMap, and that
+# the copies differ in at least one open cell
+# returns the number of clauses output
+def sudoku_pair_constraints(out, sudoku, varmap):
+    first = varmap.first
+    store = ClauseStore()
+    sudoku_constraints(store, sudoku, first)
+    count = store.add_to(out)
+    count += store.shifted(varmap.offset).add_to(out)
+    differ = []
+    for (i, j) in varmap.open:
+        diff = varmap.count + len(differ) + 1
+        differ.append(diff)
+        # diff forbids both copies from holding the same number
+        for k in range(1, varmap.N + 1):
+            var = first.encode(i, j, k)
+            if var is not None:
+                out.add_clause([-diff, -var, -var - varmap.offset])
+                count += 1
+    out.add_clause(differ)
+    return count + 1
+
+# outputs the formula of every member of a PackVarMap over its own range of
+# variables; sudoku holds the members one above the other
+# returns the number of clauses output
+def sudoku_pack_constraints(out, sudoku, varmap):
+    N = varmap.N
+    count = 0
+    for c in range(len(varmap.members)):
+        if varmap.stores is not None:
+            store = varmap.stores[c]
+        else:
+            store = ClauseStore()
+            sudoku_constraints(store, sudoku[c * N:c * N + N], varmap.members[c])
+        if varmap.offsets[c] > 0:
+            store = store.shifted(varmap.offsets[c])
+        count += store.add_to(out)
+    return count
+
+# outputs the whole formula of sudoku over varmap (the reduced one for a
+# ReducedVarMap, the two copies of a PairVarMap, every member of a
+# PackVarMap), forbidding every solution of others
+# returns the number of clauses output
+def sudoku_constraints(out, sudoku, varmap, others=[]):
+    if isinstance(varmap, PackVarMap):
+        count = sudoku_pack_constraints(out, sudoku, varmap)
+    elif isinstance(varmap, PairVarMap):
+        count = sudoku_pair_constraints(out, sudoku, varmap)
+    elif isinstance(varmap, ReducedVarMap):
+        count = sudoku_reduced_constraints(out, varmap)
+    else:
+        count = sudoku_generic_constraints(out, varmap)
+        count += sudoku_specific_constraints(out, sudoku, varmap)
+    for other in others:
+        count += sudoku_other_solution_constraint(out, other, varmap, sudoku)
+    return count
+
+# the generic constraints only depend on N and on the encoding, so they are
+# written once per size in a template file and copied into every instance
+# bump ENCODING_VERSION whenever sudoku_generic_constraints changes
+ENCODING_VERSION = 4
+TEMPLATE_DIR = os.environ.get("SUDOKU_TEMPLATE_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "cnf_templates"))
+
+# True once this process removed the private files of dead writers
+_templates_cleaned = False
+
+# removes the private files (<template>.<pid>) left in TEMPLATE_DIR by the
+# writers of templates killed before renaming them, the ones whose process
+# is gone
+def sudoku_template_cleanup():
+    for tmp in glob.glob(os.path.join(TEMPLATE_DIR, "generic-*.cnf.*")):
+        pid = tmp[tmp.rfind(".") + 1:]
+        if not pid.isdigit():
+            continue
+        try:
+            os.kill(int(pid), 0)
+        except ProcessLookupError:
+            try:
+                os.remove(tmp)
+            except FileNotFoundError:
+                pass
+        except PermissionError:
+            # alive, run by another user
+            pass
+
+# returns the path of the template for size N and the at-most-one encoding
+# of varmap, building it on first use
+# the first line of a template is a comment holding its number of clauses, of
+# variables and of literals
+def sudoku_template(varmap):
+    global _templates_cleaned
+    if not _templates_cleaned:
+        _templates_cleaned = True
+        sudoku_template_cleanup()
+    path = os.path.join(TEMPLATE_DIR, "generic-" + str(varmap.N) + "-" + varmap.amo
+                        + "-v" + str(ENCODING_VERSION) + ".cnf")
+    if not os.path.exists(path):
+        os.makedirs(TEMPLATE_DIR, exist_ok=True)
+        generic = sudoku_generic_clauses(varmap.N, varmap.amo)
+        # write to a private file first so that concurrent runs never
+        # see a half-written template
+        tmp = path + "." + str(os.getpid())
+        try:
+            myfile = open(tmp, "wb")
+            myfile.write(b"c generic " + str(len(generic)).encode() + b" "
+                         + str(generic.nvars).encode() + b" "
+                         + str(generic.literals()).encode() + b"\n")
+            generic.write_dimacs(myfile)
+            myfile.close()
+            os.replace(tmp, path)
+        except BaseException:
+            # interrupted, only a killed writer leaves its file behind
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+    return path
+
+# writes the complete CNF for sudoku to the binary file myfile, forbidding
+# every solution of others; the header is built from the clauses actually
+# emitted
+# with a ReducedVarMap only the formula left once the clues are applied is
+# written, with a PairVarMap the formula of both copies, with a PackVarMap the
+# formula of every member, otherwise the generic constraints come from the
+# template
+def sudoku_dump_cnf(myfile, sudoku, varmap, others=[]):
+    out = ClauseStore()
+    if isinstance(varmap, (ReducedVarMap, PairVarMap, PackVarMap)):
+        with METRICS.phase("encode"):
+            count = sudoku_constraints(out, sudoku, varmap, others)
+        with METRICS.phase("write"):
+            header = b"p cnf " + str(varmap.nvars).encode() + b" " + str(count).encode() + b"\n"
+            myfile.write(header)
+            size = len(header) + out.write_dimacs(myfile)
+        if METRICS.enabled:
+            METRICS.count("clauses", count)
+            METRICS.count("literals", out.literals())
+            METRICS.count("cnf_bytes", size)
+        return
+    with METRICS.phase("encode"):
+        count = sudoku_specific_constraints(out, sudoku, varmap)
+        for other in others:
+            count += sudoku_other_solution_constraint(out, other, varmap, sudoku)
+        template = open(sudoku_template(varmap), "rb")
+        first = template.readline()
+    fields = first.split()
+    count += int(fields[2])
+    with METRICS.phase("write"):
+        header = b"p cnf " + fields[3] + b" " + str(count).encode() + b"\n"
+        myfile.write(header)
+        size = len(header)
+        with mmap.mmap(template.fileno(), 0, access=mmap.ACCESS_READ) as generic:
+            with memoryview(generic) as view:
+                myfile.write(view[len(first):])
+                size += len(view) - len(first)
+        template.close()
+        size += out.write_dimacs(myfile)
+    if METRICS.enabled:
+        METRICS.count("clauses", count)
+        METRICS.count("literals", int(fields[4]) + out.literals())
+        METRICS.count("cnf_bytes", size)
+
+# same as sudoku_dump_cnf, in the file called filename
+def sudoku_write_cnf(filename, sudoku, varmap, others=[]):
+    myfile = open(filename, "wb")
+    sudoku_dump_cnf(myfile, sudoku, varmap, others)
+    myfile.close()
+
+def sudoku_solve(filename, varmap):
+    command = ["java", "-jar", solverpool.SAT4J_JAR, filename]
+    METRICS.count("solver_calls")
+    with METRICS.phase("solve"):
+        process = subprocess.Popen(command,
+                                   stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        out, err = process.communicate()
+    return sudoku_parse_output(out.decode("utf-8").split("\n"), varmap)
+
+# same as sudoku_solve, but the CNF of sudoku is streamed to the standard
+# input of SAT4J as it is encoded, without going through a file
+def sudoku_solve_piped(sudoku, varmap, others=[]):
+    command = ["java", "-jar", solverpool.SAT4J_JAR, "/dev/stdin"]
+    METRICS.count("solver_calls")
+    process = subprocess.Popen(command, stdin=subprocess.PIPE,
                                stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-    out, err = process.communicate()
-    for line in out.split(b'\n'):
-        line = line.decode("utf-8")
+    try:
+        sudoku_dump_cnf(process.stdin, sudoku, varmap, others)
+    except BrokenPipeError:
+        # SAT4J stopped reading, its output tells why
+        pass
+    # SAT4J reads the CNF while it is written, its start is part of the
+    # write phase
+    with METRICS.phase("solve"):
+        out, err = process.communicate()
+    return sudoku_parse_output(out.decode("utf-8").split("\n"), varmap)
+
+# reads the answer of a SAT solver in the SAT competition format, as printed
+# by SAT4J, and returns the solution decoded through varmap or []
+# the statistics of the comment lines are counted in METRICS
+def sudoku_parse_output(lines, varmap):
+    if METRICS.enabled:
+        for line in lines:
+            if line[:1] == 'c':
+                sat4j_statistic(line)
+    for line in lines:
         if line == "" or line[0] == 'c':
             continue
         if line[0] == 's':
@@ -206,163 +592,1319 @@ def sudoku_solve(filename):
             units = line.split()
             if units.pop() != '0':
                 exit("strange output from SAT solver:" + line + "\n")
-            units = [int(x) for x in units if int(x) >= 0]
-            N = len(units)
-            if N == 16:
-                N = 4
-            elif N == 81:
-                N = 9
-            elif N == 256:
-                N = 16
-            elif N == 625:
-                N = 25
-            else:
-                exit("strange output from SAT solver:" + line + "\n")
-            sudoku = [ [0 for i in range(N)] for j in range(N)]
-            # Notice that the following function only works for N = 4 or N = 9 --> fixed
-            for number in units:
-                # isolate last two digits
-                value = number % 100
-                number = number // 100
-                # isolate last digit
-                j = number % N
-                number = number // N
-                # isolate first digit
-                i = number
-                sudoku[i][j] = value
-            return sudoku
+            return sudoku_decode([int(x) for x in units], varmap)
         exit("strange output from SAT solver:" + line + "\n")
         return []
+    exit("no answer from SAT solver\n")
 
-def sudoku_generate(size, cm):
-    sudoku = [[0 for i in range(size)] for j in range(size)]
-
-    # generate a first batch of 9 clues that wont create a contradiction to create some kind of random seed for the SAT solver
-    for k in range(1,size+1):
-        i = int(random() * size)
-        j = int(random() * size)
-        sudoku[i][j] = k
-
-    # solve the sudoku with this kind of random seed
-    myfile = open("sudoku.cnf", "w")
-    myfile.write("p cnf "+ str(size*size) + str(size).zfill(2)  +" "+
-                str(sudoku_constraints_number(sudoku))+"\n")
-    sudoku_generic_constraints(myfile, size)
-    sudoku_specific_constraints(myfile, sudoku)
-    myfile.close()
+# turns a model (list of literals) back into a grid through varmap
+def sudoku_decode(model, varmap):
+    with METRICS.phase("decode"):
+        sudoku = varmap.grid()
+        for number in model:
+            if number <= 0:
+                continue
+            cell = varmap.decode(number)
+            if cell is None:
+                continue
+            i, j, value = cell
+            sudoku[i][j] = value
+    return sudoku
 
-    sudoku = sudoku_solve("sudoku.cnf")
-    sudoku_print(sys.stdout, sudoku)
+# incremental solving session for the sudokus of one size: the generic
+# constraints are loaded once in a cdcl.CDCLSolver, the clues of each query
+# are passed as assumptions and the clauses learnt by a query are kept for
+# the next ones
+# the clauses forbidding solutions are guarded by a variable assumed true
+# during their query only; once it ends they are released with the clauses
+# learnt from them, and the guard is used again by a later query, so that a
+# long-lived session does not grow with the number of queries
+# seed is the one of the solver
+class Session:
+    def __init__(self, varmap, seed=None):
+        self.varmap = varmap
+        self.solver = cdcl.CDCLSolver(varmap.count, seed)
+        # guards of no running query, and the number of clauses when each
+        # running one was taken: its clauses all come after
+        self.guards = []
+        self.starts = {}
+        with METRICS.phase("encode"):
+            generic = sudoku_generic_clauses(varmap.N, varmap.amo)
+            generic.add_to(self.solver)
+        METRICS.count("clauses", len(generic))
+        METRICS.count("literals", generic.literals())
 
-    if cm == True:
-        rand_rmv = int(random() * size) + 1
-        print("\nRemoving " + str(rand_rmv) + " clues\n")
-        for i in range(len(sudoku)):
-            for j in range(len(sudoku)):
-                if sudoku[i][j] == rand_rmv:
-                    sudoku[i][j] = 0
-
-    # remove numbers from sudoku while it produces a unique solution
-    while True:
-        sudoku_print(sys.stdout, sudoku)
-        print(" ")
-        i = int(random() * size)
-        j = int(random() * size)
-        save = sudoku[i][j]
-        sudoku[i][j] = 0
+    # yields up to limit distinct solutions of sudoku that are none of others,
+    # each one forbidden as soon as it is found
+    def enumerate(self, sudoku, limit, others=[]):
+        varmap = self.varmap
+        N = varmap.N
+        assumptions = [varmap.encode(i, j, sudoku[i][j])
+                       for i in range(N) for j in range(N) if sudoku[i][j] > 0]
+        if self.guards != []:
+            guard = self.guards.pop()
+        else:
+            guard = self.solver.nvars + 1
+            self.solver.new_var(guard)
+        self.starts[guard] = len(self.solver.clauses)
+        for other in others:
+            self.block(guard, other, sudoku)
+        # whether a clause holds the guard
+        blocked = others != []
+        assumptions.append(guard)
+        try:
+            for count in range(limit):
+                METRICS.count("solver_calls")
+                before = dict(self.solver.stats)
+                with METRICS.phase("solve"):
+                    model = self.solver.solve(assumptions)
+                if METRICS.enabled:
+                    cdcl_statistics(before, self.solver.stats)
+                if model is None:
+                    break
+                solution = sudoku_decode(model, varmap)
+                yield solution
+                self.block(guard, solution, sudoku)
+                blocked = True
+        finally:
+            # a guard without clauses was left free by the solver
+            start = self.starts.pop(guard)
+            if blocked:
+                self.solver.release(guard, start)
+                # the clauses after start moved back, at most to start
+                for other in self.starts:
+                    self.starts[other] = min(self.starts[other], start)
+            self.guards.append(guard)
+
+    # forbids the solution other of clues while guard is assumed
+    def block(self, guard, other, clues):
+        clause = [-guard] + sudoku_blocking_clause(other, self.varmap, clues)
+        self.solver.add_clause(clause)
+        METRICS.count("clauses")
+        METRICS.count("literals", len(clause))
+
+    # returns a solution of sudoku that is none of others, [] if there is none
+    def solve(self, sudoku, others=[]):
+        for solution in self.enumerate(sudoku, 1, others):
+            return solution
+        return []
+
+# solver backends: solve(sudoku, varmap, others) encodes sudoku over varmap,
+# forbidding every solution of others, and returns the solution decoded
+# through varmap, or [] if there is none
+class Backend:
+    # yields up to limit distinct solutions of sudoku, one at a time as they
+    # are found
+    def enumerate(self, sudoku, varmap, limit):
+        found = []
+        while len(found) < limit:
+            solution = self.solve(sudoku, varmap, found)
+            if solution == []:
+                break
+            found.append(solution)
+            yield solution
+
+    # returns up to limit distinct solutions of sudoku
+    def solutions(self, sudoku, varmap, limit):
+        return list(self.enumerate(sudoku, varmap, limit))
+
+    # returns two distinct solutions of sudoku found by a single query over a
+    # PairVarMap, [] if it has at most one
+    def pair(self, sudoku, varmap):
+        grid = self.solve(sudoku, PairVarMap(sudoku, varmap))
+        if grid == []:
+            return []
+        return [grid[:varmap.N], grid[varmap.N:]]
 
-        # solve sudoku
-        myfile = open("sudoku.cnf", "w")
-        myfile.write("p cnf "+ str(size*size) + str(size).zfill(2)  +" "+
-                    str(sudoku_constraints_number(sudoku))+"\n")
-        sudoku_generic_constraints(myfile, size)
-        sudoku_specific_constraints(myfile, sudoku)
-        myfile.close()
+    # releases what the backend keeps between queries
+    def close(self):
+        pass
 
-        sudoku_temp = sudoku_solve(sudoku)
+# java SAT4J, reading the CNF from a pipe, or from the file filename when one
+# is given to keep the last CNF for debugging
+class SAT4JBackend(Backend):
+    def __init__(self, filename=None):
+        self.filename = filename
 
-        #check if sudoku_temp produces a unique solution
+    def solve(self, sudoku, varmap, others=[]):
+        if self.filename is None:
+            return sudoku_solve_piped(sudoku, varmap, others)
+        sudoku_write_cnf(self.filename, sudoku, varmap, others)
+        return sudoku_solve(self.filename, varmap)
 
-        myfile = open("sudoku.cnf", "a")
-        sudoku_other_solution_constraint(myfile, sudoku_temp)
-        myfile.close()
+# in-process cdcl.CDCLSolver fed directly by the encoder, with one Session
+# per size and encoding so that the generic constraints are only loaded once
+# the reduced, pair and pack encodings depend on the clues and get a new
+# solver every time
+# seed, when given, is the one of every solver
+class CDCLBackend(Backend):
+    def __init__(self, seed=None):
+        self.seed = seed
+        self.sessions = {}
 
-        sudoku_temp = sudoku_solve(sudoku)
+    def session(self, varmap):
+        key = (varmap.N, varmap.amo)
+        if not key in self.sessions:
+            self.sessions[key] = Session(VarMap(varmap.N, varmap.amo), self.seed)
+        return self.sessions[key]
 
-        if sudoku_temp == []:
+    # every solution is found in the same session, or in the same solver
+    # for a reduced encoding
+    def enumerate(self, sudoku, varmap, limit):
+        if isinstance(varmap, (PairVarMap, PackVarMap)):
+            return Backend.enumerate(self, sudoku, varmap, limit)
+        if isinstance(varmap, ReducedVarMap):
+            return self.fresh(sudoku, varmap, limit)
+        return self.session(varmap).enumerate(sudoku, limit)
+
+    def solve(self, sudoku, varmap, others=[]):
+        if not isinstance(varmap, (ReducedVarMap, PairVarMap, PackVarMap)):
+            return self.session(varmap).solve(sudoku, others)
+        for solution in self.fresh(sudoku, varmap, 1, others):
+            return solution
+        return []
+
+    # yields up to limit distinct solutions of sudoku that are none of others
+    # from a new solver fed with the formula of varmap, each one forbidden as
+    # soon as it is found (only for a ReducedVarMap past the first one)
+    def fresh(self, sudoku, varmap, limit, others=[]):
+        solver = cdcl.CDCLSolver(varmap.count, self.seed)
+        with METRICS.phase("encode"):
+            store = ClauseStore()
+            count = sudoku_constraints(store, sudoku, varmap, others)
+            store.add_to(solver)
+        METRICS.count("clauses", count)
+        METRICS.count("literals", store.literals())
+        for found in range(limit):
+            METRICS.count("solver_calls")
+            if METRICS.enabled:
+                before = dict(solver.stats)
+            with METRICS.phase("solve"):
+                model = solver.solve()
+            if METRICS.enabled:
+                cdcl_statistics(before, solver.stats)
+            if model is None:
+                return
+            solution = sudoku_decode(model, varmap)
+            yield solution
+            clause = sudoku_blocking_clause(solution, varmap, sudoku)
+            solver.add_clause(clause)
+            METRICS.count("clauses")
+            METRICS.count("literals", len(clause))
+
+# long-lived workers of a solverpool.SolverPool, shared by every query made
+# through this backend
+class PoolBackend(Backend):
+    def __init__(self, pool):
+        self.pool = pool
+
+    def solve(self, sudoku, varmap, others=[]):
+        cnf = io.BytesIO()
+        sudoku_dump_cnf(cnf, sudoku, varmap, others)
+        METRICS.count("solver_calls")
+        with METRICS.phase("solve"):
+            lines = self.pool.solve(cnf.getvalue())
+        if lines is None:
+            exit("solver worker failed\n")
+        return sudoku_parse_output(lines, varmap)
+
+    def close(self):
+        self.pool.close()
+
+# exact cover solved with dancing links, without any SAT encoding: there is
+# one row per candidate (i, j, k) and one column per cell, line/number,
+# column/number and block/number; varmap is not used
+class DLXBackend(Backend):
+    def enumerate(self, sudoku, varmap, limit):
+        N = len(sudoku)
+        n = sudoku_block_size(N)
+        with METRICS.phase("encode"):
+            # the candidates left by the clues, as in the reduced encoding
+            reduced = ReducedVarMap(sudoku)
+            if reduced.contradiction:
+                return
+            rows = reduced.cells[1:]
+            for i in range(N):
+                for j in range(N):
+                    if sudoku[i][j] > 0:
+                        rows.append((i, j, sudoku[i][j]))
+            problem = dlx.ExactCover(4 * N * N)
+            for (i, j, k) in rows:
+                b = (i // n) * n + j // n
+                problem.add_row((i, j, k), [1 + i * N + j,
+                                            1 + N * N + i * N + k - 1,
+                                            1 + 2 * N * N + j * N + k - 1,
+                                            1 + 3 * N * N + b * N + k - 1])
+        METRICS.count("solver_calls")
+        search = problem.search(limit)
+        while True:
+            with METRICS.phase("solve"):
+                cover = next(search, None)
+            if cover is None:
+                break
+            solution = [[0 for j in range(N)] for i in range(N)]
+            for (i, j, k) in cover:
+                solution[i][j] = k
+            yield solution
+
+    # a single search already finds both solutions
+    def pair(self, sudoku, varmap):
+        found = self.solutions(sudoku, varmap, 2)
+        return found if len(found) == 2 else []
+
+    def solve(self, sudoku, varmap, others=[]):
+        for solution in self.solutions(sudoku, varmap, len(others) + 1):
+            if not solution in others:
+                return solution
+        return []
+
+# runs presolve.presolve before backend: a sudoku solved by propagation
+# alone never reaches backend, the others reach it with the numbers placed by
+# propagation as clues (and the candidates it eliminated with a reduced
+# encoding)
+class PresolveBackend(Backend):
+    def __init__(self, backend):
+        self.backend = backend
+        # queries answered without backend
+        self.skipped = 0
+
+    # the varmap of the same kind as varmap for grid, None if propagation
+    # solved it
+    def adapt(self, grid, domains, varmap):
+        if presolved(grid):
+            self.skipped += 1
+            METRICS.count("presolved")
+            return None
+        if isinstance(varmap, PairVarMap):
+            return PairVarMap(grid, self.adapt(grid, domains, varmap.first))
+        if isinstance(varmap, ReducedVarMap):
+            return ReducedVarMap(grid, domains)
+        return varmap
+
+    def enumerate(self, sudoku, varmap, limit):
+        with METRICS.phase("presolve"):
+            grid, domains = presolve(sudoku)
+        if grid is None:
+            self.skipped += 1
+            METRICS.count("presolved")
+            return iter([])
+        varmap = self.adapt(grid, domains, varmap)
+        if varmap is None:
+            # every number was forced, grid is the only solution
+            return iter([grid][:limit])
+        return self.backend.enumerate(grid, varmap, limit)
+
+    def solve(self, sudoku, varmap, others=[]):
+        with METRICS.phase("presolve"):
+            grid, domains = presolve(sudoku)
+        if grid is None:
+            self.skipped += 1
+            METRICS.count("presolved")
+            return []
+        varmap = self.adapt(grid, domains, varmap)
+        if varmap is None:
+            return [] if grid in others else grid
+        return self.backend.solve(grid, varmap, others)
+
+    def pair(self, sudoku, varmap):
+        with METRICS.phase("presolve"):
+            grid, domains = presolve(sudoku)
+        if grid is None:
+            self.skipped += 1
+            METRICS.count("presolved")
+            return []
+        varmap = self.adapt(grid, domains, varmap)
+        if varmap is None:
+            return []
+        return self.backend.pair(grid, varmap)
+
+    def close(self):
+        self.backend.close()
+
+# answers from a solutioncache.SolutionCache when it knows the solutions of
+# an equivalent sudoku, from backend otherwise, storing what backend found
+# queries forbidding other solutions are not cached
+class CacheBackend(Backend):
+    def __init__(self, backend, cache):
+        self.backend = backend
+        self.cache = cache
+
+    def enumerate(self, sudoku, varmap, limit):
+        with METRICS.phase("cache"):
+            found = self.cache.lookup(sudoku, limit)
+        if found is not None:
+            METRICS.count("cache_hits")
+            yield from found
+            return
+        found = []
+        for solution in self.backend.enumerate(sudoku, varmap, limit):
+            found.append(solution)
+            yield solution
+        with METRICS.phase("cache"):
+            self.cache.store(sudoku, found, limit)
+
+    def solve(self, sudoku, varmap, others=[]):
+        if others != []:
+            return self.backend.solve(sudoku, varmap, others)
+        # the whole search has to be seen for the solution to be stored
+        found = self.solutions(sudoku, varmap, 1)
+        return found[0] if found != [] else []
+
+    def pair(self, sudoku, varmap):
+        found = self.solutions(sudoku, varmap, 2)
+        return found if len(found) == 2 else []
+
+    def close(self):
+        self.backend.close()
+        self.cache.close()
+
+BACKENDS = {}
+BACKENDS["sat4j"] = SAT4JBackend
+BACKENDS["cdcl"] = CDCLBackend
+BACKENDS["dlx"] = DLXBackend
+
+# raised when a query does not end before its deadline
+class SolverTimeout(Exception):
+    pass
+
+# returns (backend, encoding, seed) for a configuration of a portfolio given
+# as backend[:encoding][:seed], None if text is not one
+# encoding is an at-most-one encoding or reduced, None to keep the varmap of
+# the query; seed is only for cdcl, None for no seed
+def portfolio_config(text):
+    fields = text.split(":")
+    if not fields[0] in BACKENDS or len(fields) > 3:
+        return None
+    encoding = seed = None
+    for field in fields[1:]:
+        if encoding is None and (field in AMO_ENCODINGS or field == "reduced"):
+            encoding = field
+        elif seed is None and fields[0] == "cdcl" and field.isdigit():
+            seed = int(field)
+        else:
+            return None
+    return fields[0], encoding, seed
+
+# answers a query of a portfolio with one configuration, in a process of its
+# own that leads a new process group, so that cancelling the group also
+# stops the solver processes it starts
+# sends (solutions found, None) or (None, error message) through writer
+def portfolio_race(config, sudoku, varmap, limit, others, writer):
+    os.setpgrp()
+    name, encoding, seed = config
+    try:
+        backend = CDCLBackend(seed) if seed is not None else BACKENDS[name]()
+        if encoding == "reduced":
+            varmap = ReducedVarMap(sudoku)
+        elif encoding is not None:
+            varmap = VarMap(len(sudoku), encoding)
+        if others == []:
+            found = backend.solutions(sudoku, varmap, limit)
+        else:
+            found = [backend.solve(sudoku, varmap, others)]
+            if found == [[]]:
+                found = []
+        writer.send((found, None))
+    except SystemExit as e:
+        writer.send((None, str(e).strip()))
+    except Exception as e:
+        # a solver that cannot run (java missing, ...) only loses the race
+        writer.send((None, type(e).__name__ + ": " + str(e).strip()))
+
+# stops the process of a configuration of a portfolio and its solvers
+def portfolio_cancel(process):
+    if process.is_alive():
+        try:
+            os.killpg(process.pid, signal.SIGKILL)
+        except (ProcessLookupError, PermissionError):
+            # not the leader of its group yet, it did not start anything
+            process.kill()
+    process.join()
+
+# races every configuration of configs (as taken by portfolio_config) on each
+# query, each one in its own process, and answers with the first one to
+# finish; the others are cancelled
+# a query taking more than deadline seconds raises SolverTimeout
+class PortfolioBackend(Backend):
+    def __init__(self, configs, deadline=None):
+        self.names = configs
+        self.configs = [portfolio_config(config) for config in configs]
+        self.deadline = deadline
+        # configuration that answered the last query, and how many queries
+        # each one answered first
+        self.winner = None
+        self.wins = [0] * len(configs)
+
+    # returns up to limit solutions of sudoku that are none of others, as
+    # found by the first configuration to answer
+    def race(self, sudoku, varmap, limit, others=[]):
+        end = None if self.deadline is None else time.monotonic() + self.deadline
+        # the templates of the sat4j configurations are built here, as the
+        # processes of the losers are killed, possibly while writing one
+        for name, encoding, seed in self.configs:
+            if name == "sat4j" and encoding != "reduced":
+                config_varmap = varmap if encoding is None else VarMap(len(sudoku), encoding)
+                if not isinstance(config_varmap, (ReducedVarMap, PairVarMap, PackVarMap)):
+                    sudoku_template(config_varmap)
+        processes = []
+        readers = []
+        try:
+            for config in self.configs:
+                reader, writer = multiprocessing.Pipe(False)
+                process = multiprocessing.Process(target=portfolio_race, daemon=True,
+                    args=(config, sudoku, varmap, limit, others, writer))
+                process.start()
+                # the reader only sees the end of the pipe once the process
+                # has closed its own copy of writer
+                writer.close()
+                processes.append(process)
+                readers.append(reader)
+            errors = []
+            waiting = list(readers)
+            with METRICS.phase("solve"):
+                while waiting != []:
+                    wait = None if end is None else max(end - time.monotonic(), 0)
+                    ready = multiprocessing.connection.wait(waiting, wait)
+                    if ready == []:
+                        raise SolverTimeout("timed out after " + str(self.deadline) + " seconds")
+                    for reader in ready:
+                        waiting.remove(reader)
+                        try:
+                            found, error = reader.recv()
+                        except EOFError:
+                            found, error = None, "solver process died"
+                        if error is None:
+                            self.winner = readers.index(reader)
+                            self.wins[self.winner] += 1
+                            return found
+                        errors.append(error)
+            exit("every configuration of the portfolio failed: " + errors[0] + "\n")
+        finally:
+            for process in processes:
+                portfolio_cancel(process)
+            for reader in readers:
+                reader.close()
+
+    def enumerate(self, sudoku, varmap, limit):
+        yield from self.race(sudoku, varmap, limit)
+
+    def solve(self, sudoku, varmap, others=[]):
+        found = self.race(sudoku, varmap, 1, others)
+        return found[0] if found != [] else []
+
+    def pair(self, sudoku, varmap):
+        found = self.race(sudoku, varmap, 2)
+        return found if len(found) == 2 else []
+
+# random complete grid of the given size, filled by backend
+# the first block is set to 1..size in order, which loses no solution up to
+# relabelling (symmetry breaking), and the other blocks of the diagonal,
+# which share no line, column or block, get random permutations, so the
+# solver only has to complete the rest
+# the rest is encoded reduced, a query that does not depend on what backend
+# already solved, so that the grid only depends on rng
+# the grid is then randomly relabelled, its bands, stacks, lines and columns
+# shuffled and possibly transposed
+def sudoku_fill(size, backend, varmap, rng):
+    n = sudoku_block_size(size)
+    solution = []
+    while solution == []:
+        sudoku = [[0 for i in range(size)] for j in range(size)]
+        for b in range(n):
+            numbers = list(range(1, size + 1))
+            if b > 0:
+                rng.shuffle(numbers)
+            for c in range(size):
+                sudoku[b * n + c // n][b * n + c % n] = numbers[c]
+        solution = backend.solve(sudoku, ReducedVarMap(sudoku))
+    labels = [0] + rng.sample(range(1, size + 1), size)
+    lines = [band * n + i for band in rng.sample(range(n), n) for i in rng.sample(range(n), n)]
+    columns = [stack * n + j for stack in rng.sample(range(n), n) for j in rng.sample(range(n), n)]
+    grid = [[labels[solution[i][j]] for j in columns] for i in lines]
+    if rng.random() < 0.5:
+        grid = [list(line) for line in zip(*grid)]
+    return grid
+
+# digs a minimal sudoku out of a random complete grid: every cell is tried
+# once, in a random order, and its clue is removed if the solution stays
+# unique
+# a clue that cannot be removed can never be removed later, once there are
+# fewer clues, so every clue left is needed
+# with cm every occurrence of a random number is removed first, the sudoku
+# then uses only size-1 numbers
+# the same seed gives the same sudoku
+# largest size generated in reasonable time by the in-process solvers (about
+# 20 seconds for a 16x16 with cdcl), a 25x25 does not end within 15 minutes
+# with them and is left to sat4j by default
+CDCL_GENERATE_SIZE = 16
+
+def sudoku_generate(size, cm, backend, amo="pairwise", seed=None):
+    rng = Random(seed)
+    varmap = VarMap(size, amo)
+    # most probes are settled by propagation alone
+    if not isinstance(backend, PresolveBackend):
+        backend = PresolveBackend(backend)
+    # the clues are dug in a Grid, which shares the cells of solution until
+    # the first one is removed and hands its masks to presolve at every probe
+    solution = to_grid(sudoku_fill(size, backend, varmap, rng))
+    sudoku = solution.copy()
+
+    if cm == True:
+        # every other cell is still given, so the emptied ones can only hold
+        # that number and the solution stays unique
+        number = rng.randint(1, size)
+        for i in range(size):
+            for j in range(size):
+                if sudoku[i, j] == number:
+                    sudoku.set(i, j, 0)
+
+    cells = [(i, j) for i in range(size) for j in range(size) if sudoku[i, j] > 0]
+    rng.shuffle(cells)
+    for (i, j) in cells:
+        sudoku.set(i, j, 0)
+        # solution always is one, so a single query for any other is enough
+        if backend.solve(sudoku, varmap, [solution]) != []:
+            sudoku.set(i, j, solution[i, j])
+
+    return sudoku.tolist()
+
+# packed queries: independent sudokus are solved together by a single query
+# over a PackVarMap, so that a backend starting a solver for every query
+# (SAT4J and its JVM) starts it once per pack
+# a pack holds at most PACK_BUDGET literals
+PACK_BUDGET = 1 << 22
+
+# solves sudokus with as few queries to backend as possible: consecutive
+# sudokus of the same size are packed while their formulas (reduced with
+# reduce, with the at-most-one encoding amo otherwise) fit in budget literals
+# a pack without solution is split in halves until each impossible sudoku is
+# alone, so that it does not hide the solutions of the others
+# returns their solutions in the same order, [] for the impossible ones
+def sudoku_solve_packed(sudokus, backend, reduce=False, amo="pairwise",
+                        budget=PACK_BUDGET):
+    solutions = [[] for sudoku in sudokus]
+    entries = []
+    packs = []
+    pack = []
+    literals = 0
+    for index in range(len(sudokus)):
+        sudoku = sudokus[index]
+        varmap = ReducedVarMap(sudoku) if reduce else VarMap(len(sudoku), amo)
+        if reduce and varmap.contradiction:
+            # impossible without asking the solver
+            entries.append(None)
             continue
+        with METRICS.phase("encode"):
+            store = ClauseStore()
+            sudoku_constraints(store, sudoku, varmap)
+        entries.append((sudoku, varmap, store))
+        size = store.literals()
+        if pack != [] and (literals + size > budget or varmap.N != entries[pack[0]][1].N):
+            packs.append(pack)
+            pack = []
+            literals = 0
+        pack.append(index)
+        literals += size
+    if pack != []:
+        packs.append(pack)
+    for pack in packs:
+        sudoku_solve_pack(backend, entries, pack, solutions)
+    return solutions
+
+# solves the sudokus of entries whose indices are in pack with one query,
+# and bisects pack when it has no solution
+def sudoku_solve_pack(backend, entries, pack, solutions):
+    if len(pack) == 1:
+        sudoku, varmap, store = entries[pack[0]]
+        solutions[pack[0]] = backend.solve(sudoku, varmap)
+        return
+    members = [entries[index] for index in pack]
+    varmap = PackVarMap([member[1] for member in members], [member[2] for member in members])
+    grid = backend.solve([line for member in members for line in member[0]], varmap)
+    if grid == []:
+        METRICS.count("bisections")
+        sudoku_solve_pack(backend, entries, pack[:len(pack) // 2], solutions)
+        sudoku_solve_pack(backend, entries, pack[len(pack) // 2:], solutions)
+        return
+    N = varmap.N
+    for c in range(len(pack)):
+        solutions[pack[c]] = grid[c * N:c * N + N]
+
+# batch mode: sudokus are solved concurrently by the worker processes of an
+# executor, each one with its own backend
+_batch = {}
+
+# with metrics every task returns the metrics of its query, with profile
+# every worker writes its cProfile statistics in profile.<pid>
+def batch_init(name, reduce, workers, timeout, amo, presolve=False, cache=None,
+               cache_size=100000, metrics=False, profile=None, portfolio=None,
+               deadline=None):
+    backend = make_backend(name, workers, timeout, presolve, portfolio, deadline)
+    if cache is not None:
+        backend = CacheBackend(backend, SolutionCache(cache, cache_size))
+    _batch["backend"] = backend
+    _batch["reduce"] = reduce
+    _batch["amo"] = amo
+    _batch["presolve"] = presolve
+    _batch["cache"] = cache
+    METRICS.enabled = metrics
+    _batch["profile"] = None
+    if profile is not None:
+        _batch["profile"] = (cProfile.Profile(), profile + "." + str(os.getpid()))
+        _batch["profile"][0].enable()
+
+# the metrics of the task just done, None without metrics
+# the executor does not run the atexit handlers of its workers, so the
+# profile is written after every task
+def batch_done():
+    if _batch["profile"] is not None:
+        profiler, filename = _batch["profile"]
+        profiler.dump_stats(filename)
+        profiler.enable()
+    return METRICS.as_dict() if METRICS.enabled else None
+
+# generates a sudoku of size with the seed seed in a worker process
+# returns (seed, sudoku, seconds taken, metrics)
+def batch_generate(size, cm, seed):
+    METRICS.reset()
+    start = time.monotonic()
+    sudoku = sudoku_generate(size, cm, _batch["backend"], _batch["amo"], seed)
+    return seed, sudoku, time.monotonic() - start, batch_done()
+
+# solves the sudokus in filenames in a worker process with packed queries of
+# at most budget literals
+# returns the same results as batch_solve for each file, the time of each
+# sudoku is its share of the time of the group and its metrics are the ones
+# of the whole group, whose size is given as members
+def batch_solve_pack(filenames, budget=PACK_BUDGET):
+    METRICS.reset()
+    start = time.monotonic()
+    results = []
+    sudokus = []
+    read = []
+    for filename in filenames:
+        try:
+            with METRICS.phase("read"):
+                sudokus.append(sudoku_read(filename))
+            read.append(filename)
+        except SystemExit as e:
+            results.append((filename, [], 0, str(e).strip(), False, False, None))
+    error = None
+    try:
+        solutions = sudoku_solve_packed(sudokus, _batch["backend"], _batch["reduce"],
+                                        _batch["amo"], budget)
+    except (SystemExit, SolverTimeout) as e:
+        # every sudoku of the group shares the failure
+        error = str(e).strip()
+        solutions = [[]] * len(read)
+    seconds = (time.monotonic() - start) / max(len(read), 1)
+    metrics = batch_done()
+    if metrics is not None:
+        metrics["members"] = len(read)
+    for index in range(len(read)):
+        results.append((read[index], solutions[index], seconds, error, False, False, metrics))
+    # in the order of the files
+    position = dict([(filenames[index], index) for index in range(len(filenames))])
+    return sorted(results, key=lambda result: position[result[0]])
+
+# solves the sudoku in filename in a worker process
+# returns (filename, solution, seconds taken, error message or None, True if
+# the solver was not needed, True if the solution came from the cache,
+# metrics)
+def batch_solve(filename):
+    METRICS.reset()
+    start = time.monotonic()
+    backend = _batch["backend"]
+    hits = backend.cache.hits if _batch["cache"] else 0
+    if _batch["cache"]:
+        backend = backend.backend
+    skipped = backend.skipped if _batch["presolve"] else 0
+    try:
+        with METRICS.phase("read"):
+            sudoku = sudoku_read(filename)
+        if _batch["reduce"]:
+            varmap = ReducedVarMap(sudoku)
         else:
-            print("Unique sudoku found")
-            sudoku[i][j] = save
-            break
+            varmap = VarMap(len(sudoku), _batch["amo"])
+        solution = _batch["backend"].solve(sudoku, varmap)
+    except (SystemExit, SolverTimeout) as e:
+        return (filename, [], time.monotonic() - start, str(e).strip(), False, False,
+                batch_done())
+    presolved = _batch["presolve"] and backend.skipped > skipped
+    cached = _batch["cache"] is not None and _batch["backend"].cache.hits > hits
+    return (filename, solution, time.monotonic() - start, None, presolved, cached,
+            batch_done())
+
+# the sudoku files matched by pattern, all the .txt files of a directory
+def batch_files(pattern):
+    if os.path.isdir(pattern):
+        pattern = os.path.join(pattern, "*.txt")
+    return sorted(glob.glob(pattern))
+
+# the file holding the solution of filename in the matching -sol directory
+def batch_solution_file(filename):
+    directory, name = os.path.split(filename)
+    return os.path.join(os.path.normpath(directory) + "-sol", name)
+
+# solves every sudoku matched by pattern with jobs worker processes and
+# writes each solution to myfile as soon as it is found, or in the order of
+# the files if ordered; with check the solutions are compared to the ones of
+# the matching -sol directory
+# the metrics of each sudoku are written as a JSON line to the file metrics
+# when it is given, profile is passed to batch_init
+# with pack the files are split in one group per process, each one solved by
+# packed queries of at most pack literals (see sudoku_solve_packed)
+# portfolio and deadline are passed to make_backend
+def sudoku_batch(myfile, pattern, name="sat4j", reduce=False, workers=0,
+                 timeout=None, jobs=None, ordered=False, check=False,
+                 amo="pairwise", presolve=False, cache=None, cache_size=100000,
+                 metrics=None, profile=None, pack=None, portfolio=None, deadline=None):
+    files = batch_files(pattern)
+    if files == []:
+        exit("no sudoku matches " + pattern + "\n")
+    start = time.monotonic()
+    solved = correct = skipped = hits = 0
+    jobs = jobs or os.cpu_count()
+    with concurrent.futures.ProcessPoolExecutor(jobs,
+            initializer=batch_init,
+            initargs=(name, reduce, workers, timeout, amo, presolve, cache,
+                      cache_size, metrics is not None, profile, portfolio,
+                      deadline)) as executor:
+        if pack is not None:
+            size = -(-len(files) // jobs)
+            groups = [files[first:first + size] for first in range(0, len(files), size)]
+            futures = [executor.submit(batch_solve_pack, group, pack) for group in groups]
+            if not ordered:
+                futures = concurrent.futures.as_completed(futures)
+            results = (result for future in futures for result in future.result())
+        elif ordered:
+            results = executor.map(batch_solve, files)
+        else:
+            futures = [executor.submit(batch_solve, filename) for filename in files]
+            results = (future.result() for future in
+                       concurrent.futures.as_completed(futures))
+        for (filename, solution, seconds, error, presolved, cached, query) in results:
+            if metrics is not None:
+                METRICS.write_json(metrics, {"operation": "-b", "file": filename,
+                                             "backend": name, "seconds": round(seconds, 6),
+                                             "error": error}, query)
+            myfile.write(filename + ": ")
+            if error is not None:
+                myfile.write(error + "\n")
+                continue
+            myfile.write("solved in " + str(round(seconds, 4)) + " seconds")
+            if cached:
+                hits += 1
+                myfile.write(" (cached)")
+            elif presolved:
+                skipped += 1
+                myfile.write(" (propagation only)")
+            if solution != []:
+                solved += 1
+            if check and not os.path.exists(batch_solution_file(filename)):
+                myfile.write(" (no solution file)")
+            elif check:
+                if solution == sudoku_read(batch_solution_file(filename)):
+                    correct += 1
+                    myfile.write(" (correct)")
+                else:
+                    myfile.write(" (wrong)")
+            myfile.write("\n")
+            sudoku_print(myfile, solution)
+            myfile.flush()
+    myfile.write("\n" + str(solved) + " of " + str(len(files)) + " sudokus solved")
+    if check:
+        myfile.write(", " + str(correct) + " correct")
+    if presolve:
+        myfile.write(", " + str(skipped) + " without the solver")
+    if cache is not None:
+        myfile.write(", " + str(hits) + " from the cache")
+    myfile.write(" in " + str(round(time.monotonic() - start, 4)) + " seconds\n")
+
+# generates count sudokus of size concurrently and writes them as sudokuXX.txt
+# in directory; their seeds follow seed, a random one if it is None
+# metrics and profile as for sudoku_batch
+def sudoku_generate_batch(myfile, size, cm, count, directory, name="cdcl",
+                          workers=0, timeout=None, jobs=None, seed=None,
+                          amo="pairwise", metrics=None, profile=None):
+    if seed is None:
+        seed = Random().randrange(1 << 32)
+    os.makedirs(directory, exist_ok=True)
+    width = len(str(count - 1))
+    start = time.monotonic()
+    with concurrent.futures.ProcessPoolExecutor(jobs or os.cpu_count(),
+            initializer=batch_init,
+            initargs=(name, False, workers, timeout, amo, False, None, 100000,
+                      metrics is not None, profile)) as executor:
+        futures = [executor.submit(batch_generate, size, cm, seed + index)
+                   for index in range(count)]
+        for index in range(count):
+            seed_used, sudoku, seconds, query = futures[index].result()
+            filename = os.path.join(directory, "sudoku" + str(index).zfill(max(width, 2)) + ".txt")
+            if metrics is not None:
+                METRICS.write_json(metrics, {"operation": "-cm" if cm else "-c", "file": filename,
+                                             "size": size, "seed": seed_used, "backend": name,
+                                             "seconds": round(seconds, 6)}, query)
+            file = open(filename, "w")
+            sudoku_print(file, sudoku)
+            file.close()
+            clues = sum([1 for line in sudoku for number in line if number > 0])
+            myfile.write(filename + ": generated in " + str(round(seconds, 4))
+                         + " seconds (seed " + str(seed_used) + ", "
+                         + str(clues) + " clues)\n")
+            myfile.flush()
+    myfile.write("\n" + str(count) + " sudokus generated in "
+                 + str(round(time.monotonic() - start, 4)) + " seconds\n")
 
-    return sudoku
-    
 from enum import Enum
 class Mode(Enum):
     SOLVE = 1
     UNIQUE = 2
     CREATE = 3
     CREATEMIN = 4
+    BATCH = 5
+    COUNT = 6
 
 OPTIONS = {}
 OPTIONS["-s"] = Mode.SOLVE
 OPTIONS["-u"] = Mode.UNIQUE
 OPTIONS["-c"] = Mode.CREATE
 OPTIONS["-cm"] = Mode.CREATEMIN
+OPTIONS["-b"] = Mode.BATCH
+OPTIONS["-n"] = Mode.COUNT
 
-if len(sys.argv) != 3 or not sys.argv[1] in OPTIONS :
-    sys.stdout.write("./sudokub.py <operation> <argument>\n")
-    sys.stdout.write("     where <operation> can be -s, -u, -c, -cm\n")
-    sys.stdout.write("  ./sudokub.py -s <input>.txt: solves the Sudoku in input, whatever its size\n")
-    sys.stdout.write("  ./sudokub.py -u <input>.txt: check the uniqueness of solution for Sudoku in input, whatever its size\n")
-    sys.stdout.write("  ./sudokub.py -c <size>: creates a Sudoku of appropriate <size>\n")
-    sys.stdout.write("  ./sudokub.py -cm <size>: creates a Sudoku of appropriate <size> using only <size>-1 numbers\n")
-    sys.stdout.write("    <size> is either 4, 9, 16, or 25\n")
-    exit("Bad arguments\n")
-
-mode = OPTIONS[sys.argv[1]]
-if mode == Mode.SOLVE or mode == Mode.UNIQUE:
-    filename = str(sys.argv[2])
-    sudoku = sudoku_read(filename)
-    N = len(sudoku)
-    myfile = open("sudoku.cnf", 'w')
-    # Notice that this may not be correct for N > 9
-    myfile.write("p cnf "+ str(N*N) + str(N).zfill(2)  +" "+
-                 str(sudoku_constraints_number(sudoku))+"\n")
-    sudoku_generic_constraints(myfile, N)
-    sudoku_specific_constraints(myfile, sudoku)
-    myfile.close()
-    sys.stdout.write("sudoku\n")
-    sudoku_print(sys.stdout, sudoku)
-    sudoku = sudoku_solve("sudoku.cnf")    
-    sys.stdout.write("\nsolution\n")
-    sudoku_print(sys.stdout, sudoku)
-    if sudoku != [] and mode == Mode.UNIQUE:
-        myfile = open("sudoku.cnf", 'a')
-        sudoku_other_solution_constraint(myfile, sudoku)
-        myfile.close()
-        sudoku = sudoku_solve("sudoku.cnf")
-        if sudoku == []:
-            sys.stdout.write("\nsolution is unique\n")
+# flags that may follow <argument>, True for the ones taking a value
+FLAGS = {}
+FLAGS["--reduce"] = False
+FLAGS["--backend"] = True
+FLAGS["--pool"] = True
+FLAGS["--timeout"] = True
+FLAGS["--jobs"] = True
+FLAGS["--ordered"] = False
+FLAGS["--check"] = False
+FLAGS["--dump"] = True
+FLAGS["--amo"] = True
+FLAGS["--pair"] = False
+FLAGS["--count"] = True
+FLAGS["--seed"] = True
+FLAGS["--presolve"] = False
+FLAGS["--cache"] = True
+FLAGS["--cache-size"] = True
+FLAGS["--metrics-json"] = True
+FLAGS["--profile"] = True
+FLAGS["--pack"] = False
+FLAGS["--pack-budget"] = True
+FLAGS["--portfolio"] = True
+FLAGS["--deadline"] = True
+
+# backend called name, run by a pool of long-lived workers if workers is not
+# 0 (only for the backends of solverpool.WORKER_COMMANDS), behind the
+# propagation pre-solver if presolve
+# with a list of configurations portfolio, or a deadline, the queries are
+# raced by a PortfolioBackend (of name alone without portfolio)
+def make_backend(name, workers=0, timeout=None, presolve=False, portfolio=None,
+                 deadline=None):
+    if portfolio is not None or deadline is not None:
+        backend = PortfolioBackend(portfolio or [name], deadline)
+    elif workers == 0:
+        backend = BACKENDS[name]()
+    else:
+        command = solverpool.WORKER_COMMANDS[name]()
+        backend = PoolBackend(solverpool.SolverPool(command, workers, timeout))
+    if presolve:
+        return PresolveBackend(backend)
+    return backend
+
+# library interface: importing this module has no side effect, and these
+# objects keep what is worth reusing from one call to the next, so that an
+# embedding program can make thousands of queries without setting anything
+# up again
+# sudokus and solutions are lists of lines, [] stands for no solution
+
+# encodes sudokus of any size with the at-most-one encoding amo, or only what
+# their clues leave with reduce; the varmap of each size is kept, the
+# generic constraints and templates are kept by sudoku_generic_clauses and
+# sudoku_template
+class Encoder:
+    def __init__(self, amo="pairwise", reduce=False):
+        self.amo = amo
+        self.reduce = reduce
+        self.varmaps = {}
+
+    # the varmap sudoku is encoded over
+    def varmap(self, sudoku):
+        if self.reduce:
+            return ReducedVarMap(sudoku)
+        N = len(sudoku)
+        if not N in self.varmaps:
+            self.varmaps[N] = VarMap(N, self.amo)
+        return self.varmaps[N]
+
+    # returns (clauses, varmap): the formula of sudoku forbidding every
+    # solution of others, as a ClauseStore, and the varmap it is over
+    def clauses(self, sudoku, others=[]):
+        varmap = self.varmap(sudoku)
+        store = ClauseStore(sudoku_nvars(varmap))
+        sudoku_constraints(store, sudoku, varmap, others)
+        return store, varmap
+
+    # writes the DIMACS CNF of sudoku to the binary file myfile
+    # returns the varmap to decode its models with
+    def write(self, myfile, sudoku, others=[]):
+        varmap = self.varmap(sudoku)
+        sudoku_dump_cnf(myfile, sudoku, varmap, others)
+        return varmap
+
+    # the grid of a model (list of literals) of a formula over varmap
+    def decode(self, model, varmap):
+        return sudoku_decode(model, varmap)
+
+# solves sudokus with the backend called name (as built by make_backend),
+# behind a SolutionCache in the file cache if one is given, encoding them
+# with encoder (pairwise by default)
+# the backend keeps its state between calls: the cdcl sessions with their
+# generic constraints and learnt clauses, the solver processes of workers
+class Solver:
+    def __init__(self, name="cdcl", encoder=None, workers=0, timeout=None, presolve=False,
+                 cache=None, cache_size=100000, portfolio=None, deadline=None):
+        self.encoder = encoder if encoder is not None else Encoder()
+        self.backend = make_backend(name, workers, timeout, presolve, portfolio, deadline)
+        if cache is not None:
+            self.backend = CacheBackend(self.backend, SolutionCache(cache, cache_size))
+
+    # a solution of sudoku, [] if there is none
+    def solve(self, sudoku):
+        return self.backend.solve(sudoku, self.encoder.varmap(sudoku))
+
+    # yields up to limit distinct solutions of sudoku as they are found
+    def enumerate(self, sudoku, limit):
+        return self.backend.enumerate(sudoku, self.encoder.varmap(sudoku), limit)
+
+    # returns up to limit distinct solutions of sudoku
+    def solutions(self, sudoku, limit):
+        return self.backend.solutions(sudoku, self.encoder.varmap(sudoku), limit)
+
+    # number of solutions of sudoku, counted up to limit
+    def count(self, sudoku, limit):
+        return len(self.solutions(sudoku, limit))
+
+    # True if sudoku has exactly one solution, checked with a single query
+    # over two copies of the grid with pair
+    def unique(self, sudoku, pair=False):
+        if not pair:
+            return len(self.solutions(sudoku, 2)) == 1
+        if self.backend.pair(sudoku, self.encoder.varmap(sudoku)) != []:
+            return False
+        return self.solve(sudoku) != []
+
+    def close(self):
+        self.backend.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+# generates sudokus with solver, a cdcl one by default since its incremental
+# session makes the probes cheap, which only holds up to CDCL_GENERATE_SIZE:
+# larger sizes need a sat4j solver
+# the sudokus made by a Generator with a given seed are always the same ones
+class Generator:
+    def __init__(self, solver=None, seed=None):
+        self.own = solver is None
+        self.solver = solver if solver is not None else Solver("cdcl")
+        self.rng = Random(seed)
+
+    # a sudoku of size whose every clue is needed, using only size-1 numbers
+    # with minimal; the same seed gives the same sudoku
+    def generate(self, size, minimal=False, seed=None):
+        if seed is None:
+            seed = self.rng.randrange(1 << 32)
+        return sudoku_generate(size, minimal, self.solver.backend, self.solver.encoder.amo, seed)
+
+    # closes the solver if the generator made it
+    def close(self):
+        if self.own:
+            self.solver.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+# returns the flags given in args, None if they are not valid
+# allowed maps the flags to True for the ones taking a value, FLAGS by
+# default
+def parse_flags(args, allowed=FLAGS):
+    flags = {}
+    i = 0
+    while i < len(args):
+        if not args[i] in allowed:
+            return None
+        if allowed[args[i]]:
+            if i + 1 >= len(args):
+                return None
+            flags[args[i]] = args[i + 1]
+            i += 2
+        else:
+            flags[args[i]] = True
+            i += 1
+    return flags
+
+# the command line interface, argv being the arguments of the script
+# (argv[0] its name)
+def main(argv):
+    # -n is the only operation with two arguments
+    first_flag = 4 if argv[1:2] == ["-n"] else 3
+    flags = parse_flags(argv[first_flag:])
+    if first_flag == 4 and (len(argv) < 4 or not argv[2].isdigit() or int(argv[2]) < 1):
+        flags = None
+    # probes of the generator and the solutions of -n are cheap in the
+    # incremental session of cdcl, as long as it solves the size at all
+    default = "sat4j"
+    if argv[1:2] == ["-n"]:
+        default = "cdcl"
+    elif argv[1:2] in [["-c"], ["-cm"]] and argv[2:3] != [] and argv[2].isdigit():
+        if int(argv[2]) <= CDCL_GENERATE_SIZE:
+            default = "cdcl"
+    if flags is not None and not flags.get("--backend", default) in BACKENDS:
+        flags = None
+    if flags is not None and "--dump" in flags:
+        # the processes of -b and --count do not write the CNF
+        if (flags.get("--backend", default) != "sat4j" or "--pool" in flags
+                or argv[1] == "-b" or "--count" in flags):
+            flags = None
+    if flags is not None and "--pool" in flags:
+        if not flags.get("--backend", default) in solverpool.WORKER_COMMANDS:
+            flags = None
+    if flags is not None and "--amo" in flags:
+        if not flags["--amo"] in AMO_ENCODINGS or "--reduce" in flags:
+            flags = None
+    if flags is not None and ("--count" in flags or "--seed" in flags):
+        if not argv[1] in ["-c", "-cm"]:
+            flags = None
+    if flags is not None and "--cache" in flags and argv[1] in ["-c", "-cm"]:
+        flags = None
+    if flags is not None and ("--pack" in flags or "--pack-budget" in flags):
+        # a pack is not a sudoku the wrappers of the backends could handle
+        if (argv[1] != "-b" or flags.get("--backend", default) == "dlx"
+                or "--presolve" in flags or "--cache" in flags):
+            flags = None
+    if flags is not None and ("--portfolio" in flags or "--deadline" in flags):
+        # every query is answered by new processes
+        if (argv[1:2] in [["-c"], ["-cm"]] or "--pool" in flags or "--dump" in flags
+                or "--pack" in flags or "--pack-budget" in flags):
+            flags = None
+    if flags is not None and "--portfolio" in flags:
+        if None in [portfolio_config(config) for config in flags["--portfolio"].split(",")]:
+            flags = None
+    if flags is not None and argv[1:2] in [["-c"], ["-cm"]] and len(argv) >= 3:
+        if not argv[2].isdigit() or not sudoku_valid_size(int(argv[2])):
+            flags = None
+    if len(argv) < 3 or not argv[1] in OPTIONS or flags is None:
+        sys.stdout.write("./sudokub.py <operation> <argument> [flags]\n")
+        sys.stdout.write("     where <operation> can be -s, -u, -n, -c, -cm, -b\n")
+        sys.stdout.write("  ./sudokub.py -s <input>.txt: solves the Sudoku in input, whatever its size\n")
+        sys.stdout.write("  ./sudokub.py -u <input>.txt: check the uniqueness of solution for Sudoku in input, whatever its size\n")
+        sys.stdout.write("  ./sudokub.py -n <K> <input>.txt: prints up to <K> solutions of the Sudoku in input\n")
+        sys.stdout.write("                    as they are found, and how many there are (sat4j and\n")
+        sys.stdout.write("                    --pool solve again from scratch for each solution)\n")
+        sys.stdout.write("  ./sudokub.py -c <size>: creates a Sudoku of appropriate <size>\n")
+        sys.stdout.write("  ./sudokub.py -cm <size>: creates a Sudoku of appropriate <size> using only <size>-1 numbers\n")
+        sys.stdout.write("  ./sudokub.py -b <directory|pattern>: solves all the Sudokus of a directory, or\n")
+        sys.stdout.write("                    matching a quoted pattern, in parallel\n")
+        sys.stdout.write("    <size> is a perfect square: 4, 9, 16, 25, 36, 49, 64, ...\n")
+        sys.stdout.write("     where [flags] can be\n")
+        sys.stdout.write("  --reduce: (-s, -u, -n) only encode what is left once the clues are applied\n")
+        sys.stdout.write("  --backend <name>: solver to use, sat4j (default), cdcl (in-process, the\n")
+        sys.stdout.write("                    default of -n, and of -c and -cm up to " + str(CDCL_GENERATE_SIZE) + "x"
+                         + str(CDCL_GENERATE_SIZE) + ",\n")
+        sys.stdout.write("                    for its incremental session) or dlx (exact cover, no SAT\n")
+        sys.stdout.write("                    solver); cdcl and dlx cannot generate a 25x25 in any\n")
+        sys.stdout.write("                    reasonable time\n")
+        sys.stdout.write("  --pool <workers>: (sat4j, cdcl) keep <workers> solver processes running and\n")
+        sys.stdout.write("                    send them every query\n")
+        sys.stdout.write("  --timeout <seconds>: (--pool) restart a worker that takes longer to answer\n")
+        sys.stdout.write("  --amo <encoding>: (not --reduce) at-most-one encoding, pairwise (default),\n")
+        sys.stdout.write("                    sequential, commander or product; the last three need\n")
+        sys.stdout.write("                    auxiliary variables but far fewer clauses\n")
+        sys.stdout.write("  --presolve: (-s, -u, -n, -b) place naked and hidden singles first, the\n")
+        sys.stdout.write("                    solver only gets the sudokus propagation does not solve\n")
+        sys.stdout.write("  --cache <file>: (-s, -u, -n, -b) keep the solutions in the SQLite file <file>\n")
+        sys.stdout.write("                    and answer equivalent sudokus from it\n")
+        sys.stdout.write("  --cache-size <entries>: (--cache) entries kept, 100000 by default\n")
+        sys.stdout.write("  --pair: (-u) a single query over two copies of the grid that must differ,\n")
+        sys.stdout.write("                    a second one only gets the solution of a unique sudoku\n")
+        sys.stdout.write("  --dump <file>.cnf: (sat4j, not -b nor --count) write the CNF given to the\n")
+        sys.stdout.write("                    solver in <file>.cnf instead of piping it\n")
+        sys.stdout.write("  --seed <integer>: (-c, -cm) generate the same sudoku for the same seed\n")
+        sys.stdout.write("  --count <M>: (-c, -cm) generate <M> sudokus in parallel, written in\n")
+        sys.stdout.write("                    generated_sudokus/, with the seeds following --seed\n")
+        sys.stdout.write("  --jobs <count>: (-b, --count) number of processes, the number of cores by default\n")
+        sys.stdout.write("  --ordered: (-b) print the solutions in the order of the files\n")
+        sys.stdout.write("  --check: (-b) compare the solutions to the ones of the matching -sol directory\n")
+        sys.stdout.write("  --pack: (-b, sat4j, cdcl, not --presolve nor --cache) solve many sudokus with\n")
+        sys.stdout.write("                    each query, one JVM start for a whole pack with sat4j\n")
+        sys.stdout.write("  --pack-budget <literals>: (--pack) largest CNF of a pack, "
+                         + str(PACK_BUDGET) + " literals by default\n")
+        sys.stdout.write("  --portfolio <config,...>: (-s, -u, -n, -b) race several configurations on\n")
+        sys.stdout.write("                    each query in parallel and keep the first answer; a\n")
+        sys.stdout.write("                    configuration is backend[:encoding][:seed], the encoding\n")
+        sys.stdout.write("                    being --amo one or reduced, the seed only for cdcl\n")
+        sys.stdout.write("                    (e.g. sat4j:pairwise,cdcl:sequential:1,cdcl:reduced:2)\n")
+        sys.stdout.write("  --deadline <seconds>: (-s, -u, -n, -b) give up a query taking longer and\n")
+        sys.stdout.write("                    report it as timed out\n")
+        sys.stdout.write("  --metrics-json <file>: append to <file> one JSON line per sudoku with the time\n")
+        sys.stdout.write("                    of each phase, the clauses, literals and CNF bytes emitted,\n")
+        sys.stdout.write("                    the solver calls and the statistics of the solver\n")
+        sys.stdout.write("  --profile <file>: write cProfile statistics in <file> (and <file>.<pid> for\n")
+        sys.stdout.write("                    each process of -b and --count)\n")
+        exit("Bad arguments\n")
+
+    mode = OPTIONS[argv[1]]
+    timeout = float(flags["--timeout"]) if "--timeout" in flags else None
+    portfolio = flags["--portfolio"].split(",") if "--portfolio" in flags else None
+    deadline = float(flags["--deadline"]) if "--deadline" in flags else None
+    amo = flags.get("--amo", "pairwise")
+    name = flags.get("--backend", default)
+    seed = int(flags["--seed"]) if "--seed" in flags else None
+    metrics = None
+    if "--metrics-json" in flags:
+        METRICS.enabled = True
+        metrics = open(flags["--metrics-json"], "a")
+    profile = flags.get("--profile")
+    if profile is not None:
+        profiler = cProfile.Profile()
+        # also written when exit() ends the run
+        atexit.register(profiler.dump_stats, profile)
+        profiler.enable()
+    if "--count" in flags:
+        sudoku_generate_batch(sys.stdout, int(argv[2]), mode == Mode.CREATEMIN,
+                              int(flags["--count"]), "generated_sudokus", name,
+                              int(flags.get("--pool", 0)), timeout,
+                              int(flags["--jobs"]) if "--jobs" in flags else None,
+                              seed, amo, metrics, profile)
+        return
+    if mode == Mode.BATCH:
+        sudoku_batch(sys.stdout, argv[2], name,
+                     "--reduce" in flags, int(flags.get("--pool", 0)), timeout,
+                     int(flags["--jobs"]) if "--jobs" in flags else None,
+                     "--ordered" in flags, "--check" in flags, amo,
+                     "--presolve" in flags, flags.get("--cache"),
+                     int(flags.get("--cache-size", 100000)), metrics, profile,
+                     int(flags.get("--pack-budget", PACK_BUDGET))
+                     if "--pack" in flags or "--pack-budget" in flags else None,
+                     portfolio, deadline)
+        return
+    # the other operations make a single query
+    query = {"operation": argv[1], "backend": name}
+    query_start = time.monotonic()
+    backend = make_backend(name, int(flags.get("--pool", 0)), timeout, False, portfolio, deadline)
+    racing = backend
+    if "--dump" in flags:
+        backend.filename = flags["--dump"]
+    if "--presolve" in flags:
+        backend = PresolveBackend(backend)
+    if "--cache" in flags:
+        cache = SolutionCache(flags["--cache"], int(flags.get("--cache-size", 100000)))
+        backend = CacheBackend(backend, cache)
+    if mode == Mode.COUNT:
+        limit = int(argv[2])
+        with METRICS.phase("read"):
+            sudoku = sudoku_read(str(argv[3]))
+        query["file"] = argv[3]
+        if "--reduce" in flags:
+            varmap = ReducedVarMap(sudoku)
         else:
-            sys.stdout.write("\nother solution\n")
-            sudoku_print(sys.stdout, sudoku)
-elif mode == Mode.CREATE:
-    size = int(sys.argv[2])
-    sudoku = sudoku_generate(size, False)
-    sys.stdout.write("\ngenerated sudoku\n")
-    sudoku_print(sys.stdout, sudoku)
-    file = open("generated_sudoku.txt", "w")
-    sudoku_print(file, sudoku)
-    file.close()
-    print("\nSudoku saved in generated_sudoku.txt")
-elif mode == Mode.CREATEMIN:
-    size = int(sys.argv[2])
-    sudoku = sudoku_generate(size, True)
-    sys.stdout.write("\ngenerated sudoku\n")
-    sudoku_print(sys.stdout, sudoku)
-    file = open("generated_sudoku.txt", "w")
-    sudoku_print(file, sudoku)
-    file.close()
-    print("\nSudoku saved in generated_sudoku.txt")
\ No newline at end of file
+            varmap = VarMap(len(sudoku), amo)
+        sys.stdout.write("sudoku\n")
+        sudoku_print(sys.stdout, sudoku)
+        start = last = time.monotonic()
+        count = 0
+        # the backends with an incremental session find every solution in it
+        try:
+            for solution in backend.enumerate(sudoku, varmap, limit):
+                count += 1
+                now = time.monotonic()
+                sys.stdout.write("\nsolution " + str(count) + " ("
+                                 + str(round(now - last, 4)) + " seconds)\n")
+                sudoku_print(sys.stdout, solution)
+                sys.stdout.flush()
+                last = now
+        except SolverTimeout as e:
+            sys.stdout.write("\n" + str(e) + "\n")
+            query["status"] = "timed out"
+        sys.stdout.write("\n" + str(count) + " solution" + ("" if count == 1 else "s")
+                         + (" (limit reached)" if count == limit else "")
+                         + " in " + str(round(time.monotonic() - start, 4)) + " seconds\n")
+        query["solutions"] = count
+    elif mode == Mode.SOLVE or mode == Mode.UNIQUE:
+        filename = str(argv[2])
+        with METRICS.phase("read"):
+            sudoku = sudoku_read(filename)
+        query["file"] = filename
+        if "--reduce" in flags:
+            varmap = ReducedVarMap(sudoku)
+        else:
+            varmap = VarMap(len(sudoku), amo)
+        sys.stdout.write("sudoku\n")
+        sudoku_print(sys.stdout, sudoku)
+        try:
+            if mode == Mode.UNIQUE and "--pair" in flags:
+                solutions = backend.pair(sudoku, varmap)
+                if solutions == []:
+                    solutions = backend.solutions(sudoku, varmap, 1)
+            else:
+                # a single search for both solutions with the backends that can
+                solutions = backend.solutions(sudoku, varmap, 2 if mode == Mode.UNIQUE else 1)
+        except SolverTimeout as e:
+            sys.stdout.write("\n" + str(e) + "\n")
+            query["status"] = "timed out"
+            solutions = None
+        solution = solutions[0] if solutions else []
+        if solutions is not None:
+            sys.stdout.write("\nsolution\n")
+            sudoku_print(sys.stdout, solution)
+        if solution != [] and mode == Mode.UNIQUE:
+            if len(solutions) == 1:
+                sys.stdout.write("\nsolution is unique\n")
+            else:
+                sys.stdout.write("\nother solution\n")
+                sudoku_print(sys.stdout, solutions[1])
+        query["solutions"] = len(solutions or [])
+    elif mode == Mode.CREATE:
+        size = int(argv[2])
+        sudoku = sudoku_generate(size, False, backend, amo, seed)
+        query["size"] = size
+        sys.stdout.write("\ngenerated sudoku\n")
+        sudoku_print(sys.stdout, sudoku)
+        file = open("generated_sudoku.txt", "w")
+        sudoku_print(file, sudoku)
+        file.close()
+        print("\nSudoku saved in generated_sudoku.txt")
+    elif mode == Mode.CREATEMIN:
+        size = int(argv[2])
+        sudoku = sudoku_generate(size, True, backend, amo, seed)
+        query["size"] = size
+        sys.stdout.write("\ngenerated sudoku\n")
+        sudoku_print(sys.stdout, sudoku)
+        file = open("generated_sudoku.txt", "w")
+        sudoku_print(file, sudoku)
+        file.close()
+        print("\nSudoku saved in generated_sudoku.txt")
+    if portfolio is not None and racing.winner is not None:
+        sys.stdout.write("\nanswered first by " + racing.names[racing.winner] + "\n")
+        query["winner"] = racing.names[racing.winner]
+    if metrics is not None:
+        query["seconds"] = round(time.monotonic() - query_start, 6)
+        METRICS.write_json(metrics, query)
+        metrics.close()
+    if "--cache" in flags:
+        sys.stdout.write("\ncache: " + str(cache.hits) + " hits, " + str(cache.misses)
+                         + " misses, " + str(cache.evictions) + " evictions\n")
+    backend.close()
+
+if __name__ == "__main__":
+    main(sys.argv)
@@ -0,0 +1,578 @@
+#!/usr/bin/python3
+
+# long-running solve service: the queries of sudokub.py answered over a Unix
+# domain socket, or stdin/stdout, one JSON object per line
+# the queries run in a pool of worker processes, each one keeping its backend
+# between queries (the cdcl sessions with their generic constraints and learnt
+# clauses, the solver processes of --pool, the templates), so a query pays
+# neither the start of Python nor the encoding of the generic constraints
+# at most --concurrency queries are in flight: once they all are, no more
+# requests are read until one ends, and the clients are held back by the
+# socket itself
+#
+# a request is {"id": <anything>, "op": <operation>, ...} where op is
+#   solve: "sudoku", the grid as a list of lines, 0 for an empty cell
+#   unique: "sudoku", and "pair" for a single query over two copies of it
+#   count: "sudoku" and "limit", the largest number of solutions wanted
+#   generate: "size", "minimal" to use only size-1 numbers, "seed"
+# every request gets a final response with its id, "status" ("ok" or
+# "error") and the "seconds" spent in the worker, and
+#   solve: "solution", null if there is none
+#   unique: "solution", "unique" and the "other" solution if there is one
+#   count: "count", after a {"id", "index", "solution"} line per solution
+#   generate: "sudoku"
+#   error: "error", the message
+# responses are written as soon as their query ends, not in the order of the
+# requests
+#
+# ./sudokuserver.py serve <socket|-> [flags]: runs the service
+# ./sudokuserver.py client <socket> <operation> <argument> [flags]: makes one
+#     query like sudokub.py would
+# ./sudokuserver.py load <socket> <directory|pattern|size> [flags]: sends
+#     many queries over concurrent connections and reports the throughput
+#     and the latencies
+
+import os
+import sys
+import json
+import stat
+import time
+import signal
+import socket
+import asyncio
+import concurrent.futures
+
+from sudokub import (Solver, Encoder, Generator, sudoku_read, sudoku_print,
+                     sudoku_valid_size, sudoku_template, batch_files, VarMap, CDCLBackend,
+                     AMO_ENCODINGS, BACKENDS, parse_flags)
+import solverpool
+
+# longest request or response line, a 100x100 grid takes about 40 KB
+LINE_LIMIT = 1 << 24
+
+OPERATIONS = ["solve", "unique", "count", "generate"]
+
+# state of a worker process: its Solver and Generator
+_worker = {}
+
+# sets up the Solver of a worker process; the generic constraints of the
+# sizes in warm are loaded (cdcl) or written as templates (sat4j) before
+# any query
+def worker_init(name, reduce, workers, timeout, amo, presolve, cache, cache_size, warm):
+    # interrupting the service stops the workers through the executor
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    solver = Solver(name, Encoder(amo, reduce), workers, timeout, presolve, cache, cache_size)
+    _worker["solver"] = solver
+    _worker["generator"] = Generator(solver)
+    for N in warm:
+        varmap = VarMap(N, amo)
+        inner = solver.backend
+        while hasattr(inner, "backend"):
+            inner = inner.backend
+        if isinstance(inner, CDCLBackend):
+            inner.session(varmap)
+        elif name == "sat4j" and not reduce:
+            sudoku_template(varmap)
+
+# returns the pid of the worker, used to start every worker before the
+# first request
+def worker_ready():
+    return os.getpid()
+
+# answers request (already checked) in a worker process
+# returns the list of its responses, without their id
+def worker_query(request):
+    start = time.monotonic()
+    solver = _worker["solver"]
+    operation = request["op"]
+    try:
+        if operation == "generate":
+            sudoku = _worker["generator"].generate(request["size"], request.get("minimal", False),
+                                                   request.get("seed"))
+            responses = [{"sudoku": sudoku}]
+        else:
+            sudoku = request["sudoku"]
+            if operation == "solve":
+                solution = solver.solve(sudoku)
+                responses = [{"solution": solution if solution != [] else None}]
+            elif operation == "unique":
+                # both solutions are sent when there are two
+                if request.get("pair", False):
+                    varmap = solver.encoder.varmap(sudoku)
+                    solutions = solver.backend.pair(sudoku, varmap)
+                    if solutions == []:
+                        solutions = solver.solutions(sudoku, 1)
+                else:
+                    solutions = solver.solutions(sudoku, 2)
+                response = {"solution": solutions[0] if solutions != [] else None,
+                            "unique": len(solutions) == 1}
+                if len(solutions) > 1:
+                    response["other"] = solutions[1]
+                responses = [response]
+            else:
+                solutions = solver.solutions(sudoku, request["limit"])
+                responses = [{"index": index + 1, "solution": solutions[index]}
+                             for index in range(len(solutions))]
+                responses.append({"count": len(solutions)})
+        responses[-1]["status"] = "ok"
+    except SystemExit as e:
+        responses = [{"status": "error", "error": str(e).strip()}]
+    except Exception as e:
+        # a solver that cannot run (java missing, a broken cache, ...) fails
+        # this query only
+        responses = [{"status": "error", "error": error_message(e)}]
+    responses[-1]["seconds"] = round(time.monotonic() - start, 6)
+    return responses
+
+# message of exception e, its type when it has none
+def error_message(e):
+    message = str(e).strip()
+    if message == "":
+        return type(e).__name__
+    return type(e).__name__ + ": " + message
+
+# True if value is an integer (and not a boolean)
+def is_integer(value):
+    return isinstance(value, int) and not isinstance(value, bool)
+
+# returns the error message of request, None if it can be answered
+def check_request(request):
+    if not isinstance(request, dict):
+        return "a request is a JSON object"
+    if not request.get("op") in OPERATIONS:
+        return "op should be one of " + ", ".join(OPERATIONS)
+    if request["op"] == "generate":
+        if not is_integer(request.get("size")) or not sudoku_valid_size(request["size"]):
+            return "size should be a perfect square (4, 9, 16, 25, 36, ...)"
+        if "seed" in request and not is_integer(request["seed"]):
+            return "seed should be an integer"
+        return None
+    sudoku = request.get("sudoku")
+    if not isinstance(sudoku, list) or not sudoku_valid_size(len(sudoku)):
+        return "sudoku should be a list of lines, as many as a perfect square"
+    N = len(sudoku)
+    for line in sudoku:
+        if not isinstance(line, list) or len(line) != N:
+            return "every line of sudoku should have " + str(N) + " cells"
+        for number in line:
+            if not is_integer(number) or number < 0 or number > N:
+                return "every cell of sudoku should be an integer from 0 to " + str(N)
+    if request["op"] == "count":
+        if not is_integer(request.get("limit")) or request["limit"] < 1:
+            return "limit should be a positive integer"
+    return None
+
+# writer of a regular file, for stdin/stdout redirected from or to one,
+# which the pipe transports of asyncio do not accept
+class FileWriter:
+    def __init__(self, myfile):
+        self.myfile = myfile
+
+    def write(self, data):
+        self.myfile.write(data)
+        self.myfile.flush()
+
+    async def drain(self):
+        pass
+
+    def close(self):
+        pass
+
+# stream reader of stdin and stream writer of stdout
+async def stdio_streams():
+    loop = asyncio.get_running_loop()
+    reader = asyncio.StreamReader(LINE_LIMIT)
+    try:
+        await loop.connect_read_pipe(lambda: asyncio.StreamReaderProtocol(reader), sys.stdin)
+    except ValueError:
+        reader.feed_data(sys.stdin.buffer.read())
+        reader.feed_eof()
+    try:
+        transport, protocol = await loop.connect_write_pipe(asyncio.streams.FlowControlMixin,
+                                                            sys.stdout)
+        writer = asyncio.StreamWriter(transport, protocol, reader, loop)
+    except ValueError:
+        writer = FileWriter(sys.stdout.buffer)
+    return reader, writer
+
+class Server:
+    # queries run by executor (whose workers were set up by worker_init), at
+    # most concurrency of them at a time; make_executor returns a new one
+    # when a worker dies and breaks it
+    def __init__(self, make_executor, concurrency):
+        self.make_executor = make_executor
+        self.executor = make_executor()
+        self.slots = asyncio.Semaphore(concurrency)
+        self.answered = 0
+
+    # answers request and writes its responses to writer, one line at a
+    # time under lock, the lock of the connection
+    # releases the slot taken for it
+    async def query(self, request, writer, lock):
+        ident = request.get("id") if isinstance(request, dict) else None
+        try:
+            error = check_request(request)
+            if error is not None:
+                responses = [{"status": "error", "error": error}]
+            else:
+                executor = self.executor
+                try:
+                    responses = await asyncio.get_running_loop().run_in_executor(
+                        executor, worker_query, request)
+                except concurrent.futures.process.BrokenProcessPool:
+                    responses = [{"status": "error", "error": "worker process died"}]
+                    if self.executor is executor:
+                        self.executor = self.make_executor()
+                except Exception as e:
+                    # a request or a response the executor cannot transport
+                    responses = [{"status": "error", "error": error_message(e)}]
+        finally:
+            self.slots.release()
+        self.answered += 1
+        async with lock:
+            try:
+                for response in responses:
+                    line = {"id": ident}
+                    line.update(response)
+                    writer.write((json.dumps(line) + "\n").encode())
+                    await writer.drain()
+            except ConnectionError:
+                # the client left, its other responses are dropped too
+                pass
+
+    # reads the requests of a connection, each one once a slot is free
+    async def connection(self, reader, writer):
+        lock = asyncio.Lock()
+        tasks = set()
+        try:
+            while True:
+                await self.slots.acquire()
+                try:
+                    line = await reader.readline()
+                except (ValueError, ConnectionError):
+                    # a line longer than LINE_LIMIT, the rest of the
+                    # connection cannot be read
+                    self.slots.release()
+                    break
+                if line == b"":
+                    self.slots.release()
+                    break
+                if line.strip() == b"":
+                    self.slots.release()
+                    continue
+                try:
+                    request = json.loads(line)
+                except ValueError:
+                    request = None
+                task = asyncio.ensure_future(self.query(request, writer, lock))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+            if tasks:
+                await asyncio.gather(*list(tasks))
+        finally:
+            writer.close()
+
+    def close(self):
+        self.executor.shutdown(cancel_futures=True)
+
+# runs the service on the Unix domain socket path, or on stdin/stdout if
+# path is -, until the end of stdin or SIGINT/SIGTERM
+# jobs worker processes are set up with initargs (see worker_init)
+async def serve(path, jobs, concurrency, initargs):
+    def make_executor():
+        return concurrent.futures.ProcessPoolExecutor(jobs, initializer=worker_init,
+                                                      initargs=initargs)
+
+    server = Server(make_executor, concurrency)
+    loop = asyncio.get_running_loop()
+    try:
+        await asyncio.gather(*[loop.run_in_executor(server.executor, worker_ready)
+                               for i in range(jobs)])
+        if path == "-":
+            reader, writer = await stdio_streams()
+            await server.connection(reader, writer)
+            return
+        if os.path.exists(path):
+            if not stat.S_ISSOCK(os.stat(path).st_mode):
+                exit(path + " exists and is not a socket\n")
+            os.unlink(path)
+        stop = asyncio.Event()
+        loop.add_signal_handler(signal.SIGINT, stop.set)
+        loop.add_signal_handler(signal.SIGTERM, stop.set)
+        unix = await asyncio.start_unix_server(server.connection, path, limit=LINE_LIMIT)
+        sys.stderr.write("listening on " + path + " with " + str(jobs) + " workers\n")
+        async with unix:
+            await stop.wait()
+        os.unlink(path)
+        sys.stderr.write(str(server.answered) + " requests answered\n")
+    finally:
+        server.close()
+
+# request of the client operation (an option of sudokub.py) on argument
+def client_request(operation, argument, flags):
+    if operation == "-s":
+        return {"op": "solve", "sudoku": sudoku_read(argument)}
+    if operation == "-u":
+        return {"op": "unique", "sudoku": sudoku_read(argument), "pair": "--pair" in flags}
+    if operation == "-n":
+        return {"op": "count", "sudoku": sudoku_read(argument), "limit": int(flags["--limit"])}
+    request = {"op": "generate", "size": int(argument), "minimal": operation == "-cm"}
+    if "--seed" in flags:
+        request["seed"] = int(flags["--seed"])
+    return request
+
+# sends request to the service at path and prints its responses as
+# sudokub.py prints its results
+def client(path, request):
+    request["id"] = 0
+    connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        connection.connect(path)
+    except OSError as e:
+        exit("cannot connect to " + path + ": " + e.strerror + "\n")
+    connection.sendall((json.dumps(request) + "\n").encode())
+    lines = connection.makefile("rb")
+    if "sudoku" in request:
+        sys.stdout.write("sudoku\n")
+        sudoku_print(sys.stdout, request["sudoku"])
+    while True:
+        line = lines.readline()
+        if line == b"":
+            exit("connection closed by the service\n")
+        response = json.loads(line)
+        if "index" in response:
+            sys.stdout.write("\nsolution " + str(response["index"]) + "\n")
+            sudoku_print(sys.stdout, response["solution"])
+        if "status" in response:
+            break
+    connection.close()
+    if response["status"] != "ok":
+        exit(response["error"] + "\n")
+    if request["op"] == "count":
+        sys.stdout.write("\n" + str(response["count"]) + " solution"
+                         + ("" if response["count"] == 1 else "s")
+                         + (" (limit reached)" if response["count"] == request["limit"] else "")
+                         + "\n")
+    elif request["op"] == "generate":
+        sys.stdout.write("\ngenerated sudoku\n")
+        sudoku_print(sys.stdout, response["sudoku"])
+    else:
+        sys.stdout.write("\nsolution\n")
+        sudoku_print(sys.stdout, response["solution"] or [])
+        if request["op"] == "unique" and response["solution"] is not None:
+            if response["unique"]:
+                sys.stdout.write("\nsolution is unique\n")
+            else:
+                sys.stdout.write("\nother solution\n")
+                sudoku_print(sys.stdout, response["other"])
+    sys.stdout.write("\nanswered in " + str(response["seconds"]) + " seconds by the service\n")
+
+# one connection of the load generator: sends count requests made by
+# make_request(index), at most pipeline of them waiting for their answer,
+# and appends the latency of each one to latencies (errors to errors)
+async def load_connection(path, make_request, count, pipeline, latencies, errors):
+    reader, writer = await asyncio.open_unix_connection(path, limit=LINE_LIMIT)
+    window = asyncio.Semaphore(pipeline)
+    sent = {}
+
+    async def send():
+        for index in range(count):
+            await window.acquire()
+            request = make_request(index)
+            request["id"] = index
+            sent[index] = time.monotonic()
+            writer.write((json.dumps(request) + "\n").encode())
+            await writer.drain()
+
+    sender = asyncio.ensure_future(send())
+    done = 0
+    while done < count:
+        line = await reader.readline()
+        if line == b"":
+            errors.append("connection closed by the service")
+            sender.cancel()
+            break
+        response = json.loads(line)
+        if not "status" in response:
+            continue
+        latencies.append(time.monotonic() - sent.pop(response["id"]))
+        if response["status"] != "ok":
+            errors.append(response["error"])
+        done += 1
+        window.release()
+    if done == count:
+        await sender
+    writer.close()
+
+# value below which a fraction q of the sorted values fall
+def percentile(values, q):
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+# runs clients connections of count requests each against the service at
+# path, the sudokus of sudokus taken in turn (or generated sudokus of size
+# when operation is generate), and returns the throughput and latencies
+def load(path, operation, sudokus, size, clients, count, pipeline, limit):
+    def make_maker(client):
+        def make_request(index):
+            if operation == "generate":
+                return {"op": "generate", "size": size, "seed": client * count + index}
+            request = {"op": operation, "sudoku": sudokus[(client * count + index) % len(sudokus)]}
+            if operation == "count":
+                request["limit"] = limit
+            return request
+        return make_request
+
+    async def run():
+        await asyncio.gather(*[load_connection(path, make_maker(client), count, pipeline,
+                                               latencies, errors)
+                               for client in range(clients)])
+
+    latencies = []
+    errors = []
+    start = time.monotonic()
+    try:
+        asyncio.run(run())
+    except OSError as e:
+        exit("cannot connect to " + path + ": " + str(e.strerror) + "\n")
+    seconds = time.monotonic() - start
+    latencies.sort()
+    results = {"operation": operation, "clients": clients, "requests": len(latencies),
+               "pipeline": pipeline, "errors": len(errors), "seconds": round(seconds, 6),
+               "throughput": round(len(latencies) / seconds, 3)}
+    if latencies != []:
+        results["latency"] = {"mean": round(sum(latencies) / len(latencies), 6),
+                              "p50": round(percentile(latencies, 0.5), 6),
+                              "p90": round(percentile(latencies, 0.9), 6),
+                              "p99": round(percentile(latencies, 0.99), 6),
+                              "max": round(latencies[-1], 6)}
+    if errors != []:
+        results["first error"] = errors[0]
+    return results
+
+# flags of serve, client and load, True for the ones taking a value
+SERVE_FLAGS = {}
+SERVE_FLAGS["--backend"] = True
+SERVE_FLAGS["--reduce"] = False
+SERVE_FLAGS["--amo"] = True
+SERVE_FLAGS["--presolve"] = False
+SERVE_FLAGS["--pool"] = True
+SERVE_FLAGS["--timeout"] = True
+SERVE_FLAGS["--cache"] = True
+SERVE_FLAGS["--cache-size"] = True
+SERVE_FLAGS["--jobs"] = True
+SERVE_FLAGS["--concurrency"] = True
+SERVE_FLAGS["--warm"] = True
+
+CLIENT_FLAGS = {}
+CLIENT_FLAGS["--pair"] = False
+CLIENT_FLAGS["--seed"] = True
+
+LOAD_FLAGS = {}
+LOAD_FLAGS["--operation"] = True
+LOAD_FLAGS["--clients"] = True
+LOAD_FLAGS["--requests"] = True
+LOAD_FLAGS["--pipeline"] = True
+LOAD_FLAGS["--limit"] = True
+LOAD_FLAGS["--output"] = True
+
+def usage():
+    sys.stdout.write("./sudokuserver.py serve <socket|-> [flags]: answers the requests sent to the\n")
+    sys.stdout.write("                    Unix socket <socket>, or to stdin with -\n")
+    sys.stdout.write("  --backend <name>: " + ", ".join(BACKENDS) + " (cdcl by default, its sessions\n")
+    sys.stdout.write("                    stay loaded between queries)\n")
+    sys.stdout.write("  --reduce, --amo <encoding>, --presolve, --pool <workers>, --timeout <seconds>,\n")
+    sys.stdout.write("  --cache <file>, --cache-size <entries>: as for sudokub.py, in every worker\n")
+    sys.stdout.write("  --jobs <count>: worker processes, the number of cores by default\n")
+    sys.stdout.write("  --concurrency <count>: queries in flight before requests stop being read,\n")
+    sys.stdout.write("                    twice --jobs by default\n")
+    sys.stdout.write("  --warm <size,...>: load the generic constraints of these sizes at start\n")
+    sys.stdout.write("./sudokuserver.py client <socket> <operation> <argument> [flags]: one query,\n")
+    sys.stdout.write("                    printed like sudokub.py prints it\n")
+    sys.stdout.write("     where <operation> <argument> can be -s <input>.txt, -u <input>.txt,\n")
+    sys.stdout.write("                    -n <K> <input>.txt, -c <size>, -cm <size>\n")
+    sys.stdout.write("  --pair: (-u) a single query over two copies of the grid\n")
+    sys.stdout.write("  --seed <integer>: (-c, -cm) generate the same sudoku for the same seed\n")
+    sys.stdout.write("./sudokuserver.py load <socket> <directory|pattern|size> [flags]: load generator\n")
+    sys.stdout.write("  --operation <name>: " + ", ".join(OPERATIONS) + " (solve by default),\n")
+    sys.stdout.write("                    generate takes a size instead of sudokus\n")
+    sys.stdout.write("  --clients <count>: concurrent connections, 4 by default\n")
+    sys.stdout.write("  --requests <count>: requests of each connection, 25 by default\n")
+    sys.stdout.write("  --pipeline <count>: requests of a connection waiting for their answer, 1 by default\n")
+    sys.stdout.write("  --limit <K>: (count) largest number of solutions, 10 by default\n")
+    sys.stdout.write("  --output <file>: also write the results to <file> as JSON\n")
+    exit("Bad arguments\n")
+
+# the flags given in args, usage() if they are not valid
+def read_flags(args, allowed):
+    flags = parse_flags(args, allowed)
+    if flags is None:
+        usage()
+    return flags
+
+if __name__ == "__main__":
+    if len(sys.argv) >= 3 and sys.argv[1] == "serve":
+        flags = read_flags(sys.argv[3:], SERVE_FLAGS)
+        name = flags.get("--backend", "cdcl")
+        warm = [int(size) for size in flags["--warm"].split(",")] if "--warm" in flags else []
+        if (not name in BACKENDS or not flags.get("--amo", "pairwise") in AMO_ENCODINGS
+                or ("--amo" in flags and "--reduce" in flags)
+                or ("--pool" in flags and not name in solverpool.WORKER_COMMANDS)
+                or not all([sudoku_valid_size(size) for size in warm])):
+            usage()
+        jobs = int(flags["--jobs"]) if "--jobs" in flags else os.cpu_count()
+        concurrency = int(flags.get("--concurrency", 2 * jobs))
+        initargs = (name, "--reduce" in flags, int(flags.get("--pool", 0)),
+                    float(flags["--timeout"]) if "--timeout" in flags else None,
+                    flags.get("--amo", "pairwise"), "--presolve" in flags,
+                    flags.get("--cache"), int(flags.get("--cache-size", 100000)), warm)
+        asyncio.run(serve(sys.argv[2], jobs, concurrency, initargs))
+    elif len(sys.argv) >= 5 and sys.argv[1] == "client" and sys.argv[3] in ["-s", "-u", "-c", "-cm"]:
+        flags = read_flags(sys.argv[5:], CLIENT_FLAGS)
+        if sys.argv[3] in ["-c", "-cm"] and (not sys.argv[4].isdigit()
+                                             or not sudoku_valid_size(int(sys.argv[4]))):
+            usage()
+        client(sys.argv[2], client_request(sys.argv[3], sys.argv[4], flags))
+    elif len(sys.argv) >= 6 and sys.argv[1] == "client" and sys.argv[3] == "-n":
+        flags = read_flags(sys.argv[6:], CLIENT_FLAGS)
+        if not sys.argv[4].isdigit() or int(sys.argv[4]) < 1:
+            usage()
+        flags["--limit"] = sys.argv[4]
+        client(sys.argv[2], client_request("-n", sys.argv[5], flags))
+    elif len(sys.argv) >= 4 and sys.argv[1] == "load":
+        flags = read_flags(sys.argv[4:], LOAD_FLAGS)
+        operation = flags.get("--operation", "solve")
+        if not operation in OPERATIONS:
+            usage()
+        size = None
+        sudokus = []
+        if operation == "generate":
+            if not sys.argv[3].isdigit() or not sudoku_valid_size(int(sys.argv[3])):
+                usage()
+            size = int(sys.argv[3])
+        else:
+            files = batch_files(sys.argv[3])
+            if files == []:
+                exit("no sudoku matches " + sys.argv[3] + "\n")
+            sudokus = [sudoku_read(filename) for filename in files]
+        results = load(sys.argv[2], operation, sudokus, size,
+                       int(flags.get("--clients", 4)), int(flags.get("--requests", 25)),
+                       int(flags.get("--pipeline", 1)), int(flags.get("--limit", 10)))
+        sys.stdout.write(str(results["requests"]) + " requests over " + str(results["clients"])
+                         + " connections in " + str(round(results["seconds"], 4)) + " seconds, "
+                         + str(results["throughput"]) + " requests per second, "
+                         + str(results["errors"]) + " errors\n")
+        if "latency" in results:
+            latency = results["latency"]
+            sys.stdout.write("latency: mean " + str(round(latency["mean"], 4))
+                             + ", p50 " + str(round(latency["p50"], 4))
+                             + ", p90 " + str(round(latency["p90"], 4))
+                             + ", p99 " + str(round(latency["p99"], 4))
+                             + ", max " + str(round(latency["max"], 4)) + " seconds\n")
+        if "first error" in results:
+            sys.stdout.write("first error: " + results["first error"] + "\n")
+        if "--output" in flags:
+            myfile = open(flags["--output"], "w")
+            json.dump(results, myfile, indent=1)
+            myfile.close()
+    else:
+        usage()